@@ -9,6 +9,24 @@ from ui.interface import create_interface
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def warm_up():
+    """
+    Paie les coûts du premier appel avant d'ouvrir l'interface : construction du workflow,
+    chargement du modèle d'embeddings et création du client Groq (sans appel facturé à l'API).
+    """
+    from orchestrator.agent import get_agent
+    from orchestrator.tools import preload_rag_resources
+
+    logger.info("Step: Warming up agent, embedding model and LLM client...")
+    try:
+        get_agent()
+        # Les erreurs de chargement sont déjà journalisées par preload_rag_resources
+        preload_rag_resources({})
+        logger.info("Warm-up completed.")
+    except Exception as e:
+        # Le warm-up n'est qu'une optimisation : l'application démarre quand même
+        logger.warning(f"Warm-up failed, first query will be slower: {e}")
+
 def main():
     logger.info("Starting the Agentic TradePilot Application...")
 
@@ -24,11 +42,20 @@ def main():
     logger.info("The Agentic AI will handle document fetching and RAG updates dynamically.")
     print("The Agentic AI will handle document fetching and RAG updates dynamically.")
 
-    # 3. Lancer l'interface
+    # 3. Préchauffer les modèles et connexions
+    warm_up()
+
+    # 4. Lancer l'interface
     # create_interface va obtenir l'agent via get_agent()
     logger.info("Step: Launching Gradio interface...")
     iface = create_interface()
-    iface.launch(share=True) # Set share=False for local only
+    # File d'attente : plusieurs questions traitées en parallèle (le client Groq garde ses connexions ouvertes)
+    iface.queue(default_concurrency_limit=config.GRADIO_CONCURRENCY_LIMIT, max_size=config.GRADIO_QUEUE_MAX_SIZE)
+    iface.launch(
+        share=config.GRADIO_SHARE, # Set GRADIO_SHARE=True for a temporary public link
+        server_name=config.GRADIO_SERVER_NAME,
+        server_port=config.GRADIO_SERVER_PORT
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
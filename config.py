@@ -12,21 +12,73 @@ CHUNK_OVERLAP = 150
 
 # Embeddings
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64 # Chunks encoded per forward pass
+EMBEDDING_GPU_BATCH_SIZE = 256 # Same, when the model runs on a GPU
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") # "cpu", "cuda", "cuda:1"... ; par défaut le GPU s'il est disponible
 # FAISS
 FAISS_INDEX_PATH = PROJECT_ROOT / "retrieval" / "faiss_index"
-# BM25 (if persisted)
-BM25_MODEL_PATH = PROJECT_ROOT / "retrieval" / "bm25_model.pkl"
+# Type d'index : "auto" (FP16 exact sous FAISS_IVF_MIN_VECTORS, sinon IVF+PQ) ou une chaîne faiss.index_factory
+FAISS_INDEX_TYPE = "auto"
+FAISS_IVF_INDEX_FACTORY = "IVF256,PQ48" # 256 listes inversées, codes PQ de 48 octets (384 dims / 48 = 8 dims par sous-quantifieur)
+FAISS_IVF_MIN_VECTORS = 10000 # En dessous, la recherche exacte est déjà rapide et l'entraînement IVF peu fiable
+FAISS_NPROBE = 8 # Listes inversées visitées par requête
+FAISS_BINARY_QUANTIZATION = False # Présélection sur des codes binaires (1 bit/dim) puis re-scoring FP16
+FAISS_BINARY_RESCORE_FACTOR = 4 # Candidats binaires re-scorés = k * facteur
+# BM25 (bm25s, persisted as a directory of sparse arrays)
+BM25_MODEL_PATH = PROJECT_ROOT / "retrieval" / "bm25_index"
 
 # File where PDF's SHA Signature is saved
 PDFS_SIGNATURE_PATH = PROJECT_ROOT / "retrieval" / "last_pdfs_signature.txt"
+# Digest de chaque PDF avec son (mtime, taille) : seuls les fichiers modifiés sont relus pour la signature
+PDF_HASH_CACHE_PATH = PROJECT_ROOT / "data" / ".pdf_hash_cache.json"
+# Chunks (PDF chargés + découpés) mis en cache avec leur signature (nom, mtime, taille des PDFs)
+CHUNKS_CACHE_PATH = PROJECT_ROOT / "retrieval" / "chunks.pkl"
+# Codes HS et index inversé de leurs descriptions, reconstruits si hs_code_descriptions.json change
+HS_INDEX_CACHE_PATH = PROJECT_ROOT / "data" / "hs_index.pkl"
 
 # Retriever
 ENSEMBLE_WEIGHTS = [0.6, 0.4] # FAISS, BM25
 RETRIEVER_K = 6 # Number of documents to retrieve
 
+# Context sent to the LLM (token budget instead of character slicing)
+CONTEXT_TOKEN_ENCODING = "cl100k_base" # tiktoken encoding used to count prompt tokens
+CONTEXT_MAX_TOKENS_PER_DOC = 200
+CONTEXT_MAX_TOKENS = 2000 # Global budget across the RETRIEVER_K documents
+
 # LLM - Groq
 GROQ_API_KEY = os.getenv("GROQ_API_KEY") # Set via environment variable
 GROQ_MODEL_NAME = "llama-3.3-70b-versatile" # Or "Qwen/Qwen2.5-3B-Instruct" for local
+ANSWER_MAX_TOKENS = 1024 # Réponse conversationnelle (SYSTEM_PROMPT)
+STRUCTURED_ANSWER_MAX_TOKENS = 256 # Réponse au format INSTRUCTIONS_PROMPT (4 champs courts)
+STRUCTURED_ANSWER_STOP = ["\n\nQuestion:", "---"] # Arrête le décodage après le dernier champ
+LLM_HTTP_TIMEOUT = 60.0 # Seconds
+LLM_HTTP_MAX_CONNECTIONS = 16
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = 8 # Connexions gardées ouvertes (pas de nouveau handshake TLS)
+LLM_CACHE_DIR = PROJECT_ROOT / "data" / "llm_cache" # Réponses d'extraction déjà analysées (un JSON par requête)
+LLM_CACHE_TTL_DAYS = 7
+ANSWER_CACHE_DIR = PROJECT_ROOT / "data" / "answer_cache" # Réponses RAG par (question normalisée, corpus indexé)
+ANSWER_CACHE_TTL_HOURS = 24
+SCRAPE_CACHE_DIR = PROJECT_ROOT / "data" / "scrape_cache" # Dernier scraping par (exportateur, importateur, produit)
+SCRAPE_TTL_HOURS = 24 # Au-delà, le site est scrapé à nouveau
+EXTRACTION_BATCH_CONCURRENCY = 8 # Extractions (appels LLM) simultanées dans extract_trade_info_batch
+EXTRACTION_MARSHAL_BATCH_SIZE = 12 # Requêtes par appel LLM dans extract_trade_info_marshaled (au-delà, la latence croît vite)
+# Cache sémantique (requêtes reformulées) : désactivé par défaut, deux trajets ne différant que
+# par un pays peuvent dépasser le seuil de similarité
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_DIR = PROJECT_ROOT / "data" / "semantic_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.92 # Similarité cosinus minimale pour réutiliser une réponse
+SEMANTIC_CACHE_MAX_ENTRIES = 1000 # Au-delà, les requêtes les moins récemment utilisées sont évincées
+
+# Workflow : checkpoints SQLite (langgraph-checkpoint-sqlite) si un chemin est donné, sinon aucun
+# (chaque question est un run indépendant, jamais repris : rien à sauvegarder entre les nœuds)
+WORKFLOW_CHECKPOINT_DB = os.getenv("WORKFLOW_CHECKPOINT_DB")
+
+# Interface Gradio
+GRADIO_SHARE = False # True ouvre un tunnel public gradio.live (chaque requête passe par un relais externe)
+GRADIO_SERVER_NAME = "0.0.0.0"
+GRADIO_SERVER_PORT = 7860
+GRADIO_CONCURRENCY_LIMIT = 4 # Questions traitées en parallèle
+GRADIO_QUEUE_MAX_SIZE = 32 # Requêtes en attente au-delà desquelles les nouvelles sont refusées
 
 # Prompts
 SYSTEM_PROMPT = """You are a professional legal document assistant. Provide clear, accurate answers based on the provided legal documents.
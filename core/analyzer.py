@@ -1,15 +1,41 @@
 # core/analyzer.py
 from models.llm_client import get_llm_client # Import the client
+import functools
 import logging
+import tiktoken
 
 logger = logging.getLogger(__name__)
 
+# Bloc de contexte d'un document : l'URL d'origine (si connue) permet au LLM de citer ses sources
+CONTEXT_DOC_TEMPLATE = "Document: {title} (Source: {source}, Page: {page}){url}\nContent: {content}"
+
+@functools.lru_cache(maxsize=None)
+def _get_token_encoding(encoding_name: str):
+    """Charge l'encodeur tiktoken une seule fois par processus."""
+    return tiktoken.get_encoding(encoding_name)
+
 class LegalDocumentAnalyzer:
-    def __init__(self, retriever, config):
+    def __init__(self, retriever, config, structured_output=False):
         self.retriever = retriever
         self.config = config
         self.model = get_llm_client(config)
         self.system_prompt = config.SYSTEM_PROMPT
+        # Le format INSTRUCTIONS_PROMPT n'attend que 4 champs courts : budget de tokens réduit
+        # et séquences d'arrêt pour couper le décodage dès que la réponse est complète
+        if structured_output:
+            self.system_prompt = config.SYSTEM_PROMPT + config.INSTRUCTIONS_PROMPT
+            self._generation_kwargs = {
+                "max_tokens": config.STRUCTURED_ANSWER_MAX_TOKENS,
+                "stop": config.STRUCTURED_ANSWER_STOP
+            }
+        else:
+            self._generation_kwargs = {"max_tokens": config.ANSWER_MAX_TOKENS}
+        # Préfixe constant du message utilisateur : seuls le contexte et la question varient
+        # (en fin de prompt), ce qui maximise le préfixe réutilisable par le cache de prompt du fournisseur
+        self._user_template_header = (
+            "Based on the following context from legal documents, please answer my question.\n"
+            "Please provide a clear, helpful answer based on this information.\n\n"
+        )
         logger.info("LegalDocumentAnalyzer initialized!")
 
     def ask(self, question: str) -> str:
@@ -25,55 +51,87 @@ class LegalDocumentAnalyzer:
             context = self._get_context(question)
 
             # Create messages for the model
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": f"""Based on the following context from legal documents, please answer my question:
-
-Question: {question}
-
-Context: {context}
-
-Please provide a clear, helpful answer based on this information."""}
-            ]
+            messages = self._build_messages(question, context)
 
             # Get response from model
-            answer = self.model.generate(messages)
+            answer = self.model.generate(messages, **self._generation_kwargs)
             return answer
 
         except Exception as e:
             logger.error(f"Error in ask: {e}")
             return f"Sorry, I encountered an error: {str(e)}"
 
+    def ask_stream(self, question: str):
+        """Same as ask, but yields the answer chunk by chunk as the LLM generates it."""
+        if self.retriever is None:
+            error_msg = "The RAG system is not ready (retriever is None). Indexes might be missing or failed to load."
+            logger.error(error_msg)
+            yield error_msg
+            return
+
+        try:
+            context = self._get_context(question)
+            messages = self._build_messages(question, context)
+            yield from self.model.generate_stream(messages, **self._generation_kwargs)
+
+        except Exception as e:
+            logger.error(f"Error in ask_stream: {e}")
+            yield f"Sorry, I encountered an error: {str(e)}"
+
+    def _build_messages(self, question: str, context: str) -> list:
+        """Builds the chat messages with a byte-identical prefix across calls."""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"{self._user_template_header}Context: {context}\n\nQuestion: {question}"}
+        ]
+
     def _get_context(self, question: str) -> str:
-        """Get and format context from retriever, including original URLs if available."""
+        """
+        Get and format context from retriever, including original URLs if available.
+        Retrieval errors propagate: ask/ask_stream turn them into an error answer, which is never cached.
+        """
         try:
             docs = self.retriever.get_relevant_documents(question)
 
             if not docs:
                 return "No relevant documents found."
 
+            # Budget de tokens : par document puis global. Les documents arrivent triés par score,
+            # ce sont donc les moins pertinents qui sont écartés une fois le budget épuisé.
+            encoding = _get_token_encoding(self.config.CONTEXT_TOKEN_ENCODING)
+            remaining_tokens = self.config.CONTEXT_MAX_TOKENS
+
             context_parts = []
+            seen_contents = set()
             for doc in docs:
+                if remaining_tokens <= 0:
+                    break
                 if hasattr(doc, 'page_content'):
-                    # Extraire les métadonnées
-                    title = doc.metadata.get('title', 'Unknown Title')
-                    source = doc.metadata.get('source', 'Unknown Source')
-                    page = doc.metadata.get('page', 'N/A')
-                    original_url = doc.metadata.get('original_url', None)
-                    
-                    # Construire la partie du contexte
-                    source_info = f"Document: {title} (Source: {source}, Page: {page})"
-                    if original_url:
-                         # Vous pouvez formater le lien comme vous voulez.
-                         # Option 1 : Texte brut
-                         # source_info += f" (Original URL: {original_url})"
-                         # Option 2 : Format Markdown (si le LLM le comprend ou si l'interface le gère)
-                         # source_info += f" (Original URL: [{os.path.basename(original_url)}]({original_url}))"
-                         # Option 3 : Format simple pour le LLM
-                         source_info += f" (URL: {original_url})"
-                         
-                    context_part = f"{source_info}\nContent: {doc.page_content[:500]}..." 
-                    context_parts.append(context_part)
+                    # FAISS et BM25 renvoient souvent le même chunk : ne pas payer ses tokens deux fois.
+                    # Clé sur le début du texte normalisé (espaces) pour attraper aussi les quasi-doublons.
+                    content_key = hash(" ".join(doc.page_content[:256].split()))
+                    if content_key in seen_contents:
+                        logger.debug(f"Skipping duplicate chunk from {doc.metadata.get('source', 'Unknown Source')}")
+                        continue
+                    seen_contents.add(content_key)
+
+                    tokens = encoding.encode(doc.page_content, disallowed_special=())
+                    kept_tokens = tokens[:min(self.config.CONTEXT_MAX_TOKENS_PER_DOC, remaining_tokens)]
+                    remaining_tokens -= len(kept_tokens)
+                    content = encoding.decode(kept_tokens)
+                    if len(kept_tokens) < len(tokens):
+                        content += "..."
+
+                    # Une seule mise en forme par document (métadonnées + contenu)
+                    metadata = doc.metadata
+                    original_url = metadata.get('original_url')
+                    context_parts.append(CONTEXT_DOC_TEMPLATE.format(
+                        title=metadata.get('title', 'Unknown Title'),
+                        source=metadata.get('source', 'Unknown Source'),
+                        page=metadata.get('page', 'N/A'),
+                        url=f" (URL: {original_url})" if original_url else "",
+                        content=content
+                    ))
                 else:
                     context_parts.append(str(doc))
 
@@ -81,5 +139,4 @@ Please provide a clear, helpful answer based on this information."""}
 
         except Exception as e:
             logger.error(f"Error retrieving context: {e}")
-            return f"Error retrieving context: {str(e)}"
-
+            raise
@@ -1,21 +1,178 @@
 # data/loader.py
-# --- Updated to use PyMuPDFLoader with DirectoryLoader (as in the notebook) ---
+# --- Updated to use PyMuPDFLoader with a process pool (one PDF loaded and split per worker) ---
 import os
+import functools
+import itertools
 import logging
+import multiprocessing
+import pickle
+import threading
 from pathlib import Path
-from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader
-from langchain.text_splitter import CharacterTextSplitter # Or RecursiveCharacterTextSplitter
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
+from retrieval.helpers import compute_pdfs_stat_signature
 
 logger = logging.getLogger(__name__)
 
-def load_and_split_pdfs(pdf_directory: Path, chunk_size: int, chunk_overlap: int):
+# Séparateurs utilisés par le splitter, du plus large au plus fin
+TEXT_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+# Workers démarrés par spawn : le parent a déjà des threads (téléchargements, chargement de torch en parallèle)
+# et un fork à ce moment peut hériter d'un verrou tenu et bloquer le worker
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# Table de traduction construite une fois : tous les caractères de contrôle blancs remplacés en une passe
+WHITESPACE_TRANSLATION = str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '})
+
+def _make_text_splitter(chunk_size: int, chunk_overlap: int):
+    # Découpage récursif (paragraphes -> lignes -> phrases -> mots) : des chunks plus réguliers,
+    # donc moins d'embeddings/insertions FAISS pour le même corpus
+    return RecursiveCharacterTextSplitter(
+        separators=TEXT_SEPARATORS,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+def parse_single_pdf(pdf_path: str, chunk_size: int, chunk_overlap: int):
     """
-    Loads PDFs from a directory using DirectoryLoader + PyMuPDFLoader and splits them into chunks.
+    Charge et découpe un seul PDF (fonction de niveau module pour être picklable par le process pool).
+    Le découpage se fait dans le worker : il est parallélisé avec l'extraction au lieu de tourner ensuite dans le parent.
     """
-    logger.info(f"Loading PDFs from {pdf_directory}")
+    try:
+        pages = PyMuPDFLoader(pdf_path).load()
+    except Exception as e:
+        logger.error(f"Error loading PDF {pdf_path}: {e}")
+        return []
+    return _make_text_splitter(chunk_size, chunk_overlap).split_documents(pages)
+
+# Découpages lancés pendant le scraping (parse_pdf_in_background) : {chemin: (signature du fichier, Future)}
+_background_executor = None
+_background_parses = {}
+_background_lock = threading.Lock()
+
+def _pdf_parse_signature(pdf_path: str, chunk_size: int, chunk_overlap: int):
+    stat = os.stat(pdf_path)
+    return (stat.st_mtime_ns, stat.st_size, chunk_size, chunk_overlap)
+
+def parse_pdf_in_background(pdf_path: str, chunk_size: int, chunk_overlap: int):
+    """
+    Lance le chargement et le découpage d'un PDF dès son téléchargement, dans un pool de processus partagé :
+    le découpage des premiers PDFs recouvre le téléchargement des suivants.
+    parse_pdfs_in_parallel récupère ensuite le résultat au lieu de refaire le travail.
+    """
+    global _background_executor
+    pdf_path = str(Path(pdf_path).resolve())
+    signature = _pdf_parse_signature(pdf_path, chunk_size, chunk_overlap)
+    with _background_lock:
+        if _background_executor is None:
+            _background_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=_MP_CONTEXT)
+        _background_parses[pdf_path] = (signature, _background_executor.submit(parse_single_pdf, pdf_path, chunk_size, chunk_overlap))
+
+def discard_background_parses():
+    """
+    Annule/oublie les découpages en arrière-plan non récupérés (nouveau scraping, index réutilisés,
+    chunks en cache...) : sinon leurs résultats resteraient en mémoire pour toute la vie du serveur.
+    """
+    with _background_lock:
+        entries = list(_background_parses.values())
+        _background_parses.clear()
+    for _, future in entries:
+        future.cancel()
+    if entries:
+        logger.debug(f"Discarded {len(entries)} unused background PDF parses.")
+
+def _take_background_parse(pdf_path: str, chunk_size: int, chunk_overlap: int):
+    """Chunks déjà découpés en arrière-plan pour ce fichier (inchangé depuis), sinon None."""
+    with _background_lock:
+        entry = _background_parses.pop(str(Path(pdf_path).resolve()), None)
+    if entry is None:
+        return None
+    signature, future = entry
+    try:
+        if signature != _pdf_parse_signature(pdf_path, chunk_size, chunk_overlap):
+            future.cancel()
+            return None
+        return future.result()
+    except Exception as e:
+        logger.warning(f"Background parsing of {pdf_path} failed, parsing it again: {e}")
+        return None
+
+def parse_pdfs_in_parallel(pdf_directory: Path, chunk_size: int, chunk_overlap: int):
+    """
+    Charge et découpe les PDFs du dossier avec un pool de processus (l'extraction PyMuPDF est CPU-bound,
+    les threads seraient limités par le GIL). L'ordre des chunks suit l'ordre trié des fichiers.
+    """
+    pdf_paths = [str(path) for path in sorted(pdf_directory.glob("*.pdf"))]
+    if not pdf_paths:
+        return []
+
+    results = {path: _take_background_parse(path, chunk_size, chunk_overlap) for path in pdf_paths}
+    # Découpages de fichiers qui ne sont plus dans le dossier
+    discard_background_parses()
+    remaining_paths = [path for path, chunks in results.items() if chunks is None]
+    if len(remaining_paths) < len(pdf_paths):
+        logger.info(f"{len(pdf_paths) - len(remaining_paths)} PDFs were already parsed during scraping.")
+
+    parse = functools.partial(parse_single_pdf, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    max_workers = min(len(remaining_paths), os.cpu_count() or 1)
+    if max_workers == 1:
+        results.update((path, parse(path)) for path in remaining_paths)
+    elif max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT) as executor:
+            results.update(zip(remaining_paths, executor.map(parse, remaining_paths)))
+
+    return list(itertools.chain.from_iterable(results[path] for path in pdf_paths))
+
+def _load_cached_chunks(cache_path: Path, signature: str):
+    """Retourne les chunks en cache si leur signature correspond, sinon None."""
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get("signature") == signature:
+            return cached["chunks"]
+        logger.info("PDFs or splitting parameters changed since the chunks were cached.")
+    except Exception as e:
+        logger.warning(f"Could not read chunks cache {cache_path}: {e}")
+    return None
+
+def _save_cached_chunks(cache_path: Path, signature: str, chunks):
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump({"signature": signature, "chunks": chunks}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        logger.info(f"Saved {len(chunks)} chunks to cache {cache_path}")
+    except Exception as e:
+        logger.warning(f"Could not save chunks cache to {cache_path}: {e}")
 
+def load_and_split_pdfs(pdf_directory: Path, chunk_size: int, chunk_overlap: int, cache_path: Path = None):
+    """
+    Loads PDFs from a directory using PyMuPDFLoader and splits them into chunks (one PDF per worker process).
+    If cache_path is given, the chunks are reused as long as the PDFs (name, mtime, size),
+    the URL mapping and the splitting parameters are unchanged.
+    """
     urls_mapping_file = pdf_directory.parent / 'scraped_urls.json'
+
+    signature = None
+    if cache_path is not None:
+        mapping_stat = urls_mapping_file.stat() if urls_mapping_file.exists() else None
+        signature = compute_pdfs_stat_signature(
+            pdf_directory, chunk_size, chunk_overlap, TEXT_SEPARATORS,
+            mapping_stat and (mapping_stat.st_mtime_ns, mapping_stat.st_size)
+        )
+        cached_chunks = _load_cached_chunks(Path(cache_path), signature)
+        if cached_chunks is not None:
+            logger.info(f"PDFs unchanged. Loaded {len(cached_chunks)} chunks from cache {cache_path}")
+            discard_background_parses()
+            return cached_chunks
+
+    logger.info(f"Loading PDFs from {pdf_directory}")
+
     url_map = {}
     if urls_mapping_file.exists():
         try:
@@ -33,44 +190,19 @@ def load_and_split_pdfs(pdf_directory: Path, chunk_size: int, chunk_overlap: int
     else:
         logger.info(f"URL mapping file {urls_mapping_file} not found. Proceeding without URL metadata.")
 
-    # --- Loading using DirectoryLoader + PyMuPDFLoader ---
+    # --- Loading and splitting using PyMuPDFLoader in a process pool ---
     try:
-        loader = DirectoryLoader(
-            str(pdf_directory), # DirectoryLoader usually expects a string path
-            glob="*.pdf", # Load only .pdf files directly in the directory
-                          # Use "**/*.pdf" if you want recursive loading like in the notebook
-            loader_cls=PyMuPDFLoader,
-            show_progress=True, # Optional: shows loading progress
-            use_multithreading=True # Optional: can speed up loading
-        )
-        documents = loader.load()
-        logger.info(f"Loaded {len(documents)} document objects from PDFs.")
+        splitted_docs = parse_pdfs_in_parallel(pdf_directory, chunk_size, chunk_overlap)
+        logger.info(f"Loaded and split PDFs into {len(splitted_docs)} chunks.")
     except Exception as e:
         logger.error(f"Error loading documents from {pdf_directory}: {e}")
         return []
 
-    if not documents:
+    if not splitted_docs:
         logger.warning("No documents were loaded.")
         return []
 
-    # --- Splitting ---
-    logger.info("Splitting documents...")
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
-    # Alternative: RecursiveCharacterTextSplitter
-    # text_splitter = RecursiveCharacterTextSplitter(
-    #     chunk_size=chunk_size,
-    #     chunk_overlap=chunk_overlap,
-    #     length_function=len,
-    # )
     try:
-        splitted_docs = text_splitter.split_documents(documents)
-        logger.info(f"Split into {len(splitted_docs)} chunks.")
-        
         logger.info("Adding original URLs to document metadata...")
         updated_docs = []
         for doc in splitted_docs:
@@ -89,25 +221,27 @@ def load_and_split_pdfs(pdf_directory: Path, chunk_size: int, chunk_overlap: int
                 logger.debug("Document has no identifiable source path in metadata.")
             updated_docs.append(doc)
         logger.info("Finished adding original URLs to metadata.")
+        if signature is not None:
+            _save_cached_chunks(Path(cache_path), signature, updated_docs)
         return updated_docs
     
     except Exception as e:
-        logger.error(f"Error splitting documents: {e}")
-        return [] # Return empty list on splitting error
+        logger.error(f"Error adding metadata to chunks: {e}")
+        return [] # Return empty list on post-processing error
 
 
 # Optional: Cleaning function if needed (like remove_ws from notebook)
 # Note: PyMuPDFLoader might handle some text cleaning differently than PyPDFLoader.
 # You might need to adjust this cleaning function or remove it if not needed.
 def clean_documents(docs):
-    """Simple cleaning function to remove newlines."""
+    """Simple cleaning function to remove newlines (and carriage returns / tabs)."""
     logger.info("Cleaning document chunks...")
     cleaned_docs = []
     for doc in docs:
         # Assuming page_content is a string
         if hasattr(doc, 'page_content'):
-            # Replace newlines with spaces or any other cleaning logic
-            cleaned_content = doc.page_content.replace('\n', ' ')
+            # Un seul appel C par chunk pour tous les remplacements
+            cleaned_content = doc.page_content.translate(WHITESPACE_TRANSLATION)
             # Update the page_content of the existing document object
             doc.page_content = cleaned_content
         # Append the (potentially modified) document object
@@ -1,5 +1,7 @@
  
 # models/llm_client.py
+import functools
+import httpx
 from groq import Groq
 # import torch # For local model
 # from transformers import AutoTokenizer, AutoModelForCausalLM # For local model
@@ -9,23 +11,94 @@ logger = logging.getLogger(__name__)
 
 class GroqModelClient:
     """Client for interacting with Groq API."""
-    def __init__(self, api_key, model_name):
-        self.client = Groq(api_key=api_key)
+    def __init__(self, api_key, model_name, http_client=None):
+        self.client = Groq(api_key=api_key, http_client=http_client)
         self.model_name = model_name
 
-    def generate(self, messages, max_tokens=1024, temperature=0.7):
+    def generate(self, messages, max_tokens=1024, temperature=0.7, stop=None):
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
+                stop=stop
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error calling Groq API: {e}")
             raise # Re-raise for handling upstream
 
+    def generate_stream(self, messages, max_tokens=1024, temperature=0.7, stop=None):
+        """Yields the completion text chunk by chunk as Groq streams it."""
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            logger.error(f"Error streaming from Groq API: {e}")
+            raise # Re-raise for handling upstream
+
+    def generate_until_json(self, messages, max_tokens=300, temperature=0.1):
+        """
+        Streams the completion and stops as soon as the first JSON object is closed, instead of
+        waiting for the rest of the generation (closing the stream ends it server-side).
+        Braces inside JSON strings are ignored. Returns the text received so far.
+        """
+        stream = None
+        parts = []
+        depth = 0
+        in_string = escaped = False
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                for char in delta:
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == "\\":
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"':
+                        in_string = depth > 0
+                    elif char == "{":
+                        depth += 1
+                    elif char == "}" and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            return "".join(parts)
+            return "".join(parts)
+        except Exception as e:
+            logger.error(f"Error streaming from Groq API: {e}")
+            raise # Re-raise for handling upstream
+        finally:
+            if stream is not None:
+                stream.close()
+
 # Placeholder for local Qwen model (if needed)
 # class LocalQwenModelClient:
 #     def __init__(self, model_name, ...): # Add necessary config
@@ -39,11 +112,26 @@ class GroqModelClient:
 #         # Return generated text
 #         pass
 
+@functools.lru_cache(maxsize=None)
+def _create_groq_client(api_key, model_name, timeout, max_connections, max_keepalive_connections):
+    """Un seul client par configuration : le pool httpx garde les connexions ouvertes (keep-alive) entre les appels."""
+    logger.info("Initializing Groq API client.")
+    http_client = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+    )
+    return GroqModelClient(api_key, model_name, http_client=http_client)
+
 # Factory function to choose client
 def get_llm_client(config):
     if config.GROQ_API_KEY:
-        logger.info("Initializing Groq API client.")
-        return GroqModelClient(config.GROQ_API_KEY, config.GROQ_MODEL_NAME)
+        return _create_groq_client(
+            config.GROQ_API_KEY,
+            config.GROQ_MODEL_NAME,
+            config.LLM_HTTP_TIMEOUT,
+            config.LLM_HTTP_MAX_CONNECTIONS,
+            config.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS
+        )
     else:
         # Fallback or raise error if local model setup is complex
         raise ValueError("GROQ_API_KEY not found. Local model setup not implemented here.")
@@ -1,6 +1,9 @@
 # orchestrator/agent.py
+import itertools
 import logging
-import uuid
+import os
+import threading
+import time
 from orchestrator.workflow import get_workflow_app, GraphState
 
 logger = logging.getLogger(__name__)
@@ -8,8 +11,15 @@ logger = logging.getLogger(__name__)
 class TradePilotAgent:
     def __init__(self):
         self.workflow_app = get_workflow_app()
+        # Identifiants de run uniques, sans lecture de /dev/urandom (next() est atomique sous le GIL) ;
+        # l'heure de démarrage évite de retrouver les runs d'un processus précédent dans un checkpointer persistant
+        self._run_prefix = f"{os.getpid()}-{time.time_ns()}"
+        self._run_counter = itertools.count()
         logger.info("TradePilot Agentic AI - initialized.")
 
+    def _next_thread_id(self) -> str:
+        return f"{self._run_prefix}-{next(self._run_counter)}"
+
     def run(self, user_input: str) -> str:
         logger.info(f"Agent received input: '{user_input}'")
         try:
@@ -23,7 +33,7 @@ class TradePilotAgent:
                 "final_answer": "",
             }
             
-            config_for_run = {"configurable": {"thread_id": str(uuid.uuid4())}}
+            config_for_run = {"configurable": {"thread_id": self._next_thread_id()}}
             final_state = self.workflow_app.invoke(initial_state, config=config_for_run)
             
             # La réponse finale est directement dans l'état
@@ -35,9 +45,48 @@ class TradePilotAgent:
             logger.error(f"Error during agent execution: {e}")
             return f"Sorry, the agent encountered an error: {e}"
 
+    def run_stream(self, user_input: str):
+        """
+        Same as run, but yields the answer progressively: the partial text while the
+        final LLM call streams, then the complete answer (with references) at the end.
+        """
+        logger.info(f"Agent received input (streaming): '{user_input}'")
+        try:
+            initial_state: GraphState = {
+                "user_query": user_input,
+                "extracted_info": {},
+                "scraping_status": "",
+                "scraping_success": False,
+                "mfn_data_available": False,
+                "rag_documents_count": 0,
+                "final_answer": "",
+            }
+
+            config_for_run = {"configurable": {"thread_id": self._next_thread_id()}}
+            partial_answer = ""
+            final_state = {}
+            for mode, chunk in self.workflow_app.stream(initial_state, config=config_for_run, stream_mode=["custom", "values"]):
+                if mode == "custom":
+                    partial_answer += chunk.get("token", "")
+                    yield partial_answer
+                else:
+                    final_state = chunk
+
+            final_answer = final_state.get("final_answer") or "Sorry, I couldn't generate a final answer."
+            logger.info("Agent execution completed.")
+            yield final_answer
+
+        except Exception as e:
+            logger.error(f"Error during agent execution: {e}")
+            yield f"Sorry, the agent encountered an error: {e}"
+
 _agent_instance = None
+_agent_lock = threading.Lock()
 def get_agent():
     global _agent_instance
+    # Double-checked locking : les workers Gradio peuvent appeler get_agent() en même temps
     if _agent_instance is None:
-        _agent_instance = TradePilotAgent()
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = TradePilotAgent()
     return _agent_instance
@@ -0,0 +1,61 @@
+# orchestrator/llm_cache.py
+"""Cache disque (un fichier JSON par clé SHA-256) pour les réponses LLM déjà analysées."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(*fields: str) -> str:
+    """
+    Clé SHA-256 des champs (version du prompt, modèle, requête...).
+    Chaque champ est préfixé par sa longueur sur 8 octets : ("ab", "c") et ("a", "bc") donnent des clés différentes.
+    """
+    hash_sha256 = hashlib.sha256()
+    for field in fields:
+        encoded = field.encode('utf-8')
+        hash_sha256.update(len(encoded).to_bytes(8, 'little'))
+        hash_sha256.update(encoded)
+    return hash_sha256.hexdigest()
+
+class LLMResponseCache:
+    def __init__(self, cache_dir: Path, ttl_seconds: float):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Retourne la valeur en cache, ou None si absente, expirée ou illisible."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read LLM cache entry {path}: {e}")
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            logger.debug(f"LLM cache entry {key[:16]}... expired.")
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any):
+        """Écrit l'entrée de façon atomique (fichier temporaire puis rename)."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"created_at": time.time(), "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.warning(f"Could not write LLM cache entry {key[:16]}...: {e}")
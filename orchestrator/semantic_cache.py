@@ -0,0 +1,110 @@
+# orchestrator/semantic_cache.py
+"""
+Cache sémantique : retrouve la réponse d'une requête déjà vue et formulée différemment
+("olive export tariff Morocco→US" ~ "tariff on olives Morocco to USA") par similarité d'embeddings.
+"""
+
+import copy
+import logging
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """
+    Index FAISS exact (IndexFlatIP sur embeddings normalisés = cosinus) des requêtes récentes,
+    avec en parallèle les valeurs et la date de dernier accès (éviction LRU).
+    """
+
+    def __init__(self, embed_query: Callable[[str], List[float]], cache_path: Path,
+                 threshold: float, max_entries: int):
+        self.embed_query = embed_query
+        self.cache_path = Path(cache_path)
+        self.values_path = self.cache_path.with_suffix(".pkl")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index = None
+        self._values = []
+        self._last_used = []
+        self._load()
+
+    def _load(self):
+        if self.cache_path.exists() and self.values_path.exists():
+            try:
+                index = faiss.read_index(str(self.cache_path))
+                with open(self.values_path, 'rb') as f:
+                    values, last_used = pickle.load(f)
+                if index.ntotal == len(values) == len(last_used):
+                    self._index, self._values, self._last_used = index, values, last_used
+                    logger.info(f"Loaded semantic cache {self.cache_path.name} with {index.ntotal} entries.")
+                    return
+                logger.warning(f"Semantic cache {self.cache_path} is inconsistent. Starting empty.")
+            except Exception as e:
+                logger.warning(f"Could not load semantic cache {self.cache_path}: {e}. Starting empty.")
+        self._index, self._values, self._last_used = None, [], []
+
+    def _save(self):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            faiss.write_index(self._index, str(self.cache_path))
+            with open(self.values_path, 'wb') as f:
+                pickle.dump((self._values, self._last_used), f)
+        except Exception as e:
+            logger.warning(f"Could not save semantic cache {self.cache_path}: {e}")
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray([self.embed_query(query)], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def get(self, query: str) -> Optional[Any]:
+        """Retourne la valeur de la requête en cache la plus proche si sa similarité dépasse le seuil."""
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+        vector = self._embed(query)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(vector, 1)
+            score, position = float(scores[0][0]), int(ids[0][0])
+            if position < 0 or score < self.threshold:
+                return None
+            logger.info(f"Semantic cache hit ({score:.3f}) in {self.cache_path.name}")
+            self._last_used[position] = time.time()
+            return copy.deepcopy(self._values[position])
+
+    def set(self, query: str, value: Any):
+        vector = self._embed(query)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            self._index.add(vector)
+            self._values.append(copy.deepcopy(value))
+            self._last_used.append(time.time())
+            if self._index.ntotal > self.max_entries:
+                self._evict_least_recently_used()
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._index, self._values, self._last_used = None, [], []
+            for path in (self.cache_path, self.values_path):
+                path.unlink(missing_ok=True)
+
+    def _evict_least_recently_used(self):
+        # IndexFlat décale les ids à la suppression : on reconstruit l'index (quelques centaines d'entrées)
+        keep = sorted(np.argsort(self._last_used)[-self.max_entries:])
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)[keep]
+        self._index = faiss.IndexFlatIP(vectors.shape[1])
+        self._index.add(vectors)
+        self._values = [self._values[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
@@ -1,81 +1,56 @@
 # orchestrator/tools.py 
 """Définition des outils (fonctions) utilisables par l'agent agentic (LangGraph)"""
 import os
+import asyncio
+import bisect
+import difflib
+import functools
+import itertools
 import logging
-from typing import Dict, Any
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+from typing import Dict, Any, List, Optional
 from scraper.web_scraper import scrape_trade_pdfs, clean_pdfs_folder 
-from data.loader import load_and_split_pdfs, clean_documents
-from retrieval.vector_store import VectorStoreManager
+from data.loader import load_and_split_pdfs, clean_documents, parse_pdf_in_background, discard_background_parses
+from retrieval.vector_store import VectorStoreManager, stored_indexes_match_pdfs
+from retrieval.helpers import compute_pdfs_stat_signature, dedupe_by_hash, load_signature
 from core.analyzer import LegalDocumentAnalyzer
 from models.llm_client import get_llm_client
+from orchestrator.llm_cache import LLMResponseCache, make_cache_key
+from orchestrator.semantic_cache import SemanticCache
+from langgraph.config import get_stream_writer
 import config 
 import csv
 import json
+import math
+import re
 from pathlib import Path
+try:
+    import orjson # Parseur JSON en C, plusieurs fois plus rapide que json
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
-# Charger les données au démarrage du module (une seule fois)
-# Assurez-vous que les chemins sont corrects par rapport à la racine du projet
-HS_CODES_FILE = Path(__file__).parent.parent / "data" / "json" / "hs_code_descriptions.json"
-COUNTRIES_FILE = Path(__file__).parent.parent / "data" / "csv" / "iso_country_codes.csv"
-
-try:
-    with open(HS_CODES_FILE, 'r') as f:
-        HS_DATA = json.load(f)
-    logger.info(f"Loaded {len(HS_DATA)} HS codes.")
-except Exception as e:
-    logger.error(f"Failed to load HS codes: {e}")
-    HS_DATA = []
-
-COUNTRY_MAP = {}
-COUNTRY_NAME_TO_CODE = {} # Pour la recherche inverse
-try:
-    with open(COUNTRIES_FILE, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            code = row.get('Code', '').strip()
-            name = row.get('Country Name', '').strip()
-            if code and name:
-                COUNTRY_MAP[name.lower()] = name
-                COUNTRY_NAME_TO_CODE[name.lower()] = code
-    logger.info(f"Loaded {len(COUNTRY_MAP)} country mappings.")
-except Exception as e:
-    logger.error(f"Failed to load country codes: {e}")
-    COUNTRY_MAP = {}
-    COUNTRY_NAME_TO_CODE = {}
+def _json_loads(data):
+    """json.loads via orjson si disponible (ses erreurs héritent de json.JSONDecodeError)."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
 
-def find_hs_code_for_product(product_name: str) -> str:
-    """Trouve un code HS basé sur le nom du produit."""
-    if not product_name or not HS_DATA:
-        return ""
-    for item in HS_DATA:
-        desc = item.get("description", "")
-        if product_name.lower() in desc.lower():
-            return item.get("id", "")
-    return ""
+class ToolStatus(IntEnum):
+    """Statut renvoyé par les outils à côté du message : le routage compare le code, pas le texte."""
+    OK = 0
+    ERROR = 1
+    CACHE_HIT = 2 # Succès sans travail (résultat précédent réutilisé)
+    EMPTY = 3 # Succès, mais aucun document à traiter
 
-# --- Extract_trade_info ---
-def extract_trade_info(state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Extrait les informations de pays et de produit/HS code de la requête utilisateur.
-    Gère les cas spéciaux comme les accords commerciaux.
-    """
-    user_query = state.get("user_query", "")
-    try:
-        llm_client = get_llm_client(config)
-    except Exception as e:
-        logger.error(f"Failed to initialize LLM client inside tool: {e}")
-        return {"error": f"LLM Client init failed: {e}", "extracted_info": {}}
-    
-    if not user_query:
-        logger.error("No user query provided for extraction.")
-        return {"error": "No user query provided for extraction."}
-
-    logger.info(f"Extracting trade info from query: '{user_query}'")
-    
-    # --- Prompt avec gestion des accords ---
-    extraction_prompt = f"""
+# À incrémenter à chaque modification du prompt d'extraction : invalide les réponses du cache local
+# (le cache de prompt du fournisseur, lui, se base sur le préfixe et s'invalide de lui-même)
+EXTRACTION_PROMPT_VERSION = "v3"
+# Prompt d'extraction (avec gestion des accords). Toutes les instructions sont dans le message système,
+# identique octet pour octet d'un appel à l'autre : le cache de prompt du fournisseur (par préfixe)
+# peut le réutiliser. Seule la requête, placée en dernier dans le message utilisateur, varie.
+_EXTRACTION_INSTRUCTIONS = """You are a precise data extraction tool.
 You are an expert in international trade data extraction. Your task is to identify the Exporting Country, Importing Country, and Product/HS Code from the user's query.
 
 Guidelines:
@@ -93,122 +68,792 @@ Guidelines:
 7.  Double-check the countries' names for common aliases (e.g., USA/United States, UK/United Kingdom).
 8.  If you cannot confidently identify a piece of information, leave its field as an empty string ("").
 
-Query: {user_query}
-
 Provide the answer in the following strict JSON format:
-{{
+{
   "exporter": "Country Name or Agreement Placeholder", // E.g., "Morocco" or "USMCA_Countries"
   "importer": "Country Name or Agreement Placeholder", // E.g., "United States Of America" or "USMCA_Countries"
   "product": "Product Name",  // E.g., "olives"
   "hs_code": "HS Code"        // E.g., "07099200" (can be empty if not found)
-}}
+}
 
 Example Output for a standard query:
-{{
+{
   "exporter": "Morocco",
   "importer": "United States Of America",
   "product": "olives",
   "hs_code": "07099200"
-}}
+}
 
 Example Output for an agreement query:
-{{
+{
   "exporter": "USMCA_Countries",
   "importer": "USMCA_Countries",
   "product": "agricultural products",
   "hs_code": "841934"
-}}
+}
+
+Do not include any other text, explanations, or markdown. Only output the JSON."""
+_EXTRACTION_SYSTEM_MESSAGE = {"role": "system", "content": _EXTRACTION_INSTRUCTIONS}
+_EXTRACTION_USER_TEMPLATE = "Query: {query}"
+# Plusieurs requêtes dans un seul appel (extract_trade_info_marshaled) : mêmes instructions en préfixe
+_EXTRACTION_BATCH_SYSTEM_MESSAGE = {"role": "system", "content": _EXTRACTION_INSTRUCTIONS + """
+
+Batch mode: the user message contains several numbered queries. Return a JSON array with exactly one object
+per query, in the same order, each object in the format above. Only output the JSON array."""}
+
+_extraction_cache = LLMResponseCache(config.LLM_CACHE_DIR, config.LLM_CACHE_TTL_DAYS * 24 * 3600)
+# Réponses RAG complètes, par question et par corpus indexé
+_answer_cache = LLMResponseCache(config.ANSWER_CACHE_DIR, config.ANSWER_CACHE_TTL_HOURS * 3600)
+
+# Préfixe des réponses d'erreur de LegalDocumentAnalyzer : jamais mises en cache
+ANALYZER_ERROR_MARKER = "Sorry, I encountered an error"
+
+def _rag_answer_cache_key(user_question: str) -> str:
+    """
+    Clé de la réponse RAG : question normalisée, modèle et signature des PDFs indexés
+    (sauvegardée par VectorStoreManager), donc invalidée dès que le corpus change.
+    """
+    corpus_fingerprint = load_signature(config.PDFS_SIGNATURE_PATH)
+    return make_cache_key(config.GROQ_MODEL_NAME, corpus_fingerprint, _normalize_query(user_question))
+
+@functools.lru_cache(maxsize=1)
+def _get_embeddings():
+    """Modèle d'embeddings du RAG, chargé une seule fois (index et caches sémantiques)."""
+    return VectorStoreManager(config).embeddings
+
+@functools.lru_cache(maxsize=1)
+def _get_llm():
+    return get_llm_client(config)
+
+@functools.lru_cache(maxsize=1)
+def _get_vsm():
+    """VectorStoreManager avec index chargés, partagé entre les appels d'outils jusqu'à la prochaine mise à jour du RAG."""
+    vsm = VectorStoreManager(config, embeddings=_get_embeddings())
+    vsm.build_or_load_store([])
+    return vsm
+
+def invalidate_vsm():
+    """À appeler après une modification des index : les prochains appels rechargent le store."""
+    _get_vsm.cache_clear()
+    # Les réponses en cache ont été générées avec l'ancienne base
+    rag_answers_cache = _get_semantic_cache("rag_answers")
+    if rag_answers_cache is not None:
+        rag_answers_cache.clear()
+
+@functools.lru_cache(maxsize=None)
+def _get_semantic_cache(name: str):
+    """Cache sémantique d'un outil ("extraction", "rag_answers"), ou None s'il est désactivé."""
+    if not config.SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticCache(
+        _get_embeddings().embed_query,
+        config.SEMANTIC_CACHE_DIR / f"{name}.faiss",
+        threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES
+    )
+
+# Fichiers JSON produits par le scraper (mfn_data.json, scraped_urls.json) : {chemin: ((mtime, taille), contenu)}
+_json_file_cache: Dict[str, tuple] = {}
+
+def _load_json_cached(path) -> Any:
+    """
+    Contenu JSON du fichier, relu uniquement si sa date de modification ou sa taille a changé.
+    Le contenu est partagé entre les appels : à ne pas modifier.
+    """
+    path = str(path)
+    stat = os.stat(path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    cached = _json_file_cache.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        data = _json_loads(f.read())
+    _json_file_cache[path] = (stat_key, data)
+    return data
+
+# Données de référence chargées au premier usage (une seule fois), pas à l'import du module
+# Assurez-vous que les chemins sont corrects par rapport à la racine du projet
+HS_CODES_FILE = Path(__file__).parent.parent / "data" / "json" / "hs_code_descriptions.json"
+COUNTRIES_FILE = Path(__file__).parent.parent / "data" / "csv" / "iso_country_codes.csv"
+
+@functools.lru_cache(maxsize=1)
+def _load_hs_snapshot():
+    """
+    Données HS et index inversé de leurs descriptions, relus depuis un pickle tant que le JSON
+    n'a pas changé (mtime, taille) : quelques ms au lieu du parsing + construction de l'index à chaque démarrage.
+    """
+    try:
+        stat = HS_CODES_FILE.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except OSError as e:
+        logger.error(f"Failed to load HS codes: {e}")
+        return [], {}
+
+    cache_path = Path(config.HS_INDEX_CACHE_PATH)
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get("signature") == signature:
+                logger.info(f"Loaded {len(cached['hs_data'])} HS codes from {cache_path.name}.")
+                return cached["hs_data"], cached["token_index"]
+        except Exception as e:
+            logger.warning(f"Could not read HS index cache {cache_path}: {e}")
+
+    try:
+        with open(HS_CODES_FILE, 'rb') as f:
+            hs_data = _json_loads(f.read())
+        logger.info(f"Loaded {len(hs_data)} HS codes.")
+    except Exception as e:
+        logger.error(f"Failed to load HS codes: {e}")
+        return [], {}
+    token_index = {}
+    for position, item in enumerate(hs_data):
+        for token in set(_tokenize_description(item.get("description", ""))):
+            token_index.setdefault(token, []).append(position)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump({"signature": signature, "hs_data": hs_data, "token_index": token_index}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.warning(f"Could not save HS index cache to {cache_path}: {e}")
+    return hs_data, token_index
+
+def load_hs_data() -> List[Dict[str, str]]:
+    return _load_hs_snapshot()[0]
+
+@functools.lru_cache(maxsize=1)
+def load_country_maps():
+    """Retourne ({nom en minuscules: nom officiel}, {nom en minuscules: code ISO})."""
+    try:
+        with open(COUNTRIES_FILE, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            code_idx, name_idx = header.index('Code'), header.index('Country Name')
+            rows = [(row[code_idx].strip(), row[name_idx].strip()) for row in reader if len(row) > max(code_idx, name_idx)]
+        rows = [(code, name) for code, name in rows if code and name]
+        country_map = {name.lower(): name for _code, name in rows}
+        country_name_to_code = {name.lower(): code for code, name in rows} # Pour la recherche inverse
+        logger.info(f"Loaded {len(country_map)} country mappings.")
+        return country_map, country_name_to_code
+    except Exception as e:
+        logger.error(f"Failed to load country codes: {e}")
+        return {}, {}
+
+# Alias courants -> nom attendu par le scraper (même orthographe que le prompt d'extraction).
+# Les accords multi-pays sont ramenés à un pays membre représentatif.
+COUNTRY_ALIASES = {
+    "usa": "United States Of America",
+    "us": "United States Of America",
+    "u.s.": "United States Of America",
+    "u.s.a.": "United States Of America",
+    "united states": "United States Of America",
+    "united states of america": "United States Of America",
+    "uk": "United Kingdom",
+    "u.k.": "United Kingdom",
+    "great britain": "United Kingdom",
+    "britain": "United Kingdom",
+    "england": "United Kingdom",
+    "uae": "United Arab Emirates",
+    "emirates": "United Arab Emirates",
+    "south korea": "Korea, Republic of",
+    "russia": "Russian Federation",
+    "usmca": "United States Of America", # Ou "Mexico" ou "Canada"
+    "usmca_countries": "United States Of America",
+    "usmca countries": "United States Of America",
+    "nafta": "United States Of America",
+    "nafta_countries": "United States Of America",
+    "eu": "Germany", # Ou un autre pays membre
+    "eu_countries": "Germany",
+    "eu countries": "Germany",
+    "european union": "Germany",
+    "european union countries": "Germany",
+}
+
+@functools.lru_cache(maxsize=1)
+def _get_country_regex():
+    """
+    Une seule alternance sur tous les noms de pays et alias, du plus long au plus court
+    ("Papua New Guinea" avant "Guinea"), pour trouver un pays contenu dans un texte en un passage.
+    """
+    country_map, _country_name_to_code = load_country_maps()
+    names = sorted(set(country_map) | set(COUNTRY_ALIASES), key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b", re.IGNORECASE)
+
+def _canonical_country_name(name_lower: str) -> str:
+    country_map, _country_name_to_code = load_country_maps()
+    return COUNTRY_ALIASES.get(name_lower) or country_map.get(name_lower, "")
+
+@functools.lru_cache(maxsize=4096) # Fonction pure, mêmes produits/pays d'une session à l'autre
+def find_valid_country_name(raw_name: str) -> str:
+    """
+    Normalise un nom de pays extrait par le LLM : alias, puis nom officiel, puis nom de pays
+    contenu dans le texte ("Kingdom of Morocco" -> "Morocco"), sinon tel quel.
+    """
+    if not raw_name:
+        return ""
+    canonical = _canonical_country_name(raw_name.strip().lower())
+    if canonical:
+        return canonical
+    match = _get_country_regex().search(raw_name)
+    return _canonical_country_name(match.group(1).lower()) if match else raw_name
+
+def _tokenize_description(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+# Descriptions en minuscules et index inversé {token: [positions dans les données HS]}, construits une fois
+@functools.lru_cache(maxsize=1)
+def _get_hs_desc_lower() -> List[str]:
+    return [item.get("description", "").lower() for item in load_hs_data()]
+
+def _get_hs_token_index() -> Dict[str, List[int]]:
+    return _load_hs_snapshot()[1]
+
+@functools.lru_cache(maxsize=1)
+def _get_hs_vocabulary_buffer():
+    """Vocabulaire des descriptions concaténé ("\n" ne fait partie d'aucun token) et offset de début de chaque token."""
+    tokens = list(_get_hs_token_index())
+    starts = []
+    offset = 0
+    for token in tokens:
+        starts.append(offset)
+        offset += len(token) + 1
+    return tokens, "\n".join(tokens), starts
+
+@functools.lru_cache(maxsize=4096)
+def _hs_positions_containing(query_token: str) -> frozenset:
+    """Positions des descriptions dont un token contient query_token ("olive" -> "olives")."""
+    tokens, buffer, starts = _get_hs_vocabulary_buffer()
+    token_index = _get_hs_token_index()
+    positions = set()
+    # Recherche de sous-chaîne en C (str.find) dans le vocabulaire concaténé, au lieu d'un `in` par token
+    offset = buffer.find(query_token)
+    while offset != -1:
+        token_number = bisect.bisect_right(starts, offset) - 1
+        positions.update(token_index[tokens[token_number]])
+        # Reprendre après ce token : une seule correspondance suffit par token
+        offset = buffer.find(query_token, starts[token_number] + len(tokens[token_number]) + 1)
+    return frozenset(positions)
+
+@functools.lru_cache(maxsize=4096) # Fonction pure, mêmes produits/pays d'une session à l'autre
+def find_hs_code_for_product(product_name: str) -> str:
+    """Trouve un code HS basé sur le nom du produit (première description contenant le nom)."""
+    hs_data = load_hs_data()
+    if not product_name or not hs_data:
+        return ""
+    product_lower = product_name.lower()
+    # Chaque mot de la requête est contenu dans un token de la description : les listes de positions
+    # (intersectées de la plus courte à la plus longue) donnent les seuls candidats à vérifier
+    query_tokens = set(_tokenize_description(product_lower))
+    if query_tokens:
+        postings = sorted((_hs_positions_containing(token) for token in query_tokens), key=len)
+        candidates = sorted(postings[0].intersection(*postings[1:]))
+    else:
+        candidates = range(len(hs_data))
+    hs_desc_lower = _get_hs_desc_lower()
+    for position in candidates:
+        if product_lower in hs_desc_lower[position]:
+            return hs_data[position].get("id", "")
+    return ""
+
+@functools.lru_cache(maxsize=4096)
+def correct_product_spelling(product_name: str) -> str:
+    """
+    Remplace chaque mot absent du vocabulaire des descriptions HS par le mot le plus proche
+    ("olivs" -> "olives"), pour les noms de produits mal orthographiés. Les mots courts sont gardés tels quels.
+    """
+    vocabulary = list(_get_hs_token_index())
+    corrected = []
+    for token in _tokenize_description(product_name):
+        if len(token) >= 4 and not _hs_positions_containing(token):
+            close_matches = difflib.get_close_matches(token, vocabulary, n=1, cutoff=0.8)
+            if close_matches:
+                token = close_matches[0]
+        corrected.append(token)
+    return " ".join(corrected)
+
+# Mots présents dans plus de 2 % des descriptions ("and", "of", "other"...) : non discriminants
+HS_KEYWORD_MAX_DOC_FREQUENCY = 0.02
+
+@functools.lru_cache(maxsize=1)
+def _get_hs_keyword_weights() -> Dict[str, float]:
+    """Poids IDF des mots-clés des descriptions HS, sans les mots trop fréquents."""
+    total = len(_get_hs_desc_lower()) or 1
+    return {
+        token: math.log(total / len(token_positions))
+        for token, token_positions in _get_hs_token_index().items()
+        if len(token_positions) / total <= HS_KEYWORD_MAX_DOC_FREQUENCY
+    }
+
+def find_hs_codes_in_text(text: str, limit: int = 5, min_coverage: float = 0.0) -> List[str]:
+    """
+    Codes HS dont la description partage le plus de mots-clés avec un texte libre
+    ("frozen olives and dates"), en un seul passage sur les mots du texte : chaque mot est une
+    recherche dans l'index inversé, les descriptions sont classées par somme des poids IDF.
+    min_coverage : part minimale du poids des mots du texte couverte par la description
+    (un mot absent de toutes les descriptions, ex. "argan", compte avec le poids maximal).
+    """
+    hs_data = load_hs_data()
+    keyword_weights = _get_hs_keyword_weights()
+    token_index = _get_hs_token_index()
+    unknown_weight = math.log(len(hs_data) or 1)
+    scores = {}
+    text_weight = 0.0
+    for token in set(_tokenize_description(text)):
+        if token not in token_index:
+            text_weight += unknown_weight
+            continue
+        weight = keyword_weights.get(token)
+        if weight is None:
+            continue
+        text_weight += weight
+        for position in token_index[token]:
+            scores[position] = scores.get(position, 0.0) + weight
+    min_score = min_coverage * text_weight - 1e-9 # Tolérance d'arrondi sur les sommes de poids
+    best_positions = sorted(
+        (position for position in scores if scores[position] >= min_score),
+        key=lambda position: (-scores[position], position)
+    )[:limit]
+    return [hs_data[position].get("id", "") for position in best_positions]
+
+# Trie des codes HS (chapitre 2 chiffres -> position 4 -> sous-position 6) : nœud = {caractère: nœud},
+# la clé "" d'un nœud contient la position du code dans les données HS
+HS_CODE_FULL_LENGTH = 6 # Niveau le plus fin des données HS (HS6)
+
+@functools.lru_cache(maxsize=1)
+def _get_hs_code_trie() -> dict:
+    trie = {}
+    for position, item in enumerate(load_hs_data()):
+        node = trie
+        for char in item.get("id", ""):
+            node = node.setdefault(char, {})
+        node[""] = position
+    return trie
+
+def find_hs_codes_by_prefix(prefix: str) -> List[str]:
+    """Tous les codes HS commençant par prefix (lui compris), en ordre lexicographique."""
+    hs_data = load_hs_data()
+    node = _get_hs_code_trie()
+    for char in prefix:
+        node = node.get(char)
+        if node is None:
+            return []
+    codes = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if "" in node:
+            codes.append(hs_data[node[""]].get("id", ""))
+        stack.extend(node[char] for char in sorted((c for c in node if c), reverse=True))
+    return codes
+
+def _hs_code_position(code: str) -> int:
+    node = _get_hs_code_trie()
+    for char in code:
+        node = node[char]
+    return node[""]
+
+def refine_partial_hs_code(hs_code: str, product_name: str) -> str:
+    """
+    Précise un code HS partiel (chapitre/position) en sous-position HS6 sans appel LLM :
+    l'unique sous-position du préfixe, ou la première dont la description contient le produit.
+    """
+    full_codes = [code for code in find_hs_codes_by_prefix(hs_code) if len(code) == HS_CODE_FULL_LENGTH]
+    if len(full_codes) == 1:
+        return full_codes[0]
+    product_lower = product_name.lower()
+    if product_lower:
+        for code in full_codes:
+            position = _hs_code_position(code)
+            if product_lower in _get_hs_desc_lower()[position]:
+                return code
+    return hs_code
+
+# --- Parsing tolérant de la réponse JSON du LLM ---
+_CODE_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_LINE_COMMENT_RE = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*')
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+
+def _extract_json_object(text: str, brackets: str = "{}") -> str:
+    """Découpe le premier objet {...} (ou tableau [...]) complet (compteur de profondeur, accolades des chaînes ignorées)."""
+    opening, closing = brackets
+    start = text.find(opening)
+    if start == -1:
+        return text
+    depth = 0
+    in_string = escaped = False
+    for position in range(start, len(text)):
+        char = text[position]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == opening:
+            depth += 1
+        elif char == closing:
+            depth -= 1
+            if depth == 0:
+                return text[start:position + 1]
+    return text[start:]
+
+def _parse_llm_json(raw: str, brackets: str = "{}"):
+    """
+    Parse la réponse JSON du LLM en tolérant les écarts fréquents : bloc ```json, texte autour de l'objet,
+    commentaires // (repris du format du prompt) et virgules finales. Lève json.JSONDecodeError sinon.
+    """
+    text = _extract_json_object(_CODE_FENCE_RE.sub("", raw.strip()), brackets)
+    try:
+        return _json_loads(text)
+    except json.JSONDecodeError:
+        # Retirer les commentaires hors chaînes puis les virgules finales
+        repaired = _LINE_COMMENT_RE.sub(lambda match: match.group(1) or "", text)
+        return _json_loads(_TRAILING_COMMA_RE.sub(r"\1", repaired))
 
-Do not include any other text, explanations, or markdown. Only output the JSON.
-"""
+# --- Extraction déterministe (sans LLM) ---
+_HS_CODE_IN_QUERY_RE = re.compile(r"\b\d{6,10}\b")
+_EXPORTER_ANCHORS = {"from"}
+_IMPORTER_ANCHORS = {"to", "into"}
+
+def _rule_based_extract(query: str) -> Optional[Dict[str, str]]:
+    """
+    Extrait code HS, exportateur et importateur d'une requête déjà structurée
+    ("07099200 from Morocco to the USA"). Le rôle d'un pays vient du mot "from"/"to" qui le précède
+    (deux mots au plus), sinon de l'ordre d'apparition. Un seul pays suffit ("07099200 into the USA")
+    s'il est lui-même annoncé par "from"/"to"/"into" et que la requête n'annonce pas l'autre
+    ("from ..." non reconnu, ex. un accord) : sinon le LLM prend le relais.
+    Retourne None s'il manque le code ou tout pays.
+    """
+    hs_match = _HS_CODE_IN_QUERY_RE.search(query)
+    if not hs_match:
+        return None
+
+    exporter = importer = ""
+    unanchored = []
+    for match in _get_country_regex().finditer(query):
+        country = _canonical_country_name(match.group(1).lower())
+        if not country or country in (exporter, importer) or country in unanchored:
+            continue
+        preceding_words = set(query[:match.start()].lower().split()[-2:])
+        if not exporter and preceding_words & _EXPORTER_ANCHORS:
+            exporter = country
+        elif not importer and preceding_words & _IMPORTER_ANCHORS:
+            importer = country
+        else:
+            unanchored.append(country)
+    anchored = bool(exporter or importer)
+    if not exporter and unanchored:
+        exporter = unanchored.pop(0)
+    if not importer and unanchored:
+        importer = unanchored.pop(0)
+    if not (exporter or importer):
+        return None
+    if not (exporter and importer):
+        # Pays seul sans ancre ("tariff for 0709920000 in Japan") : exportateur ou marché ? Ambigu
+        if not anchored:
+            return None
+        # Le rôle manquant est annoncé dans la requête mais son pays n'est pas dans le gazetteer
+        query_words = set(query.lower().split())
+        missing_anchors = _IMPORTER_ANCHORS if exporter else _EXPORTER_ANCHORS
+        if query_words & missing_anchors:
+            return None
+
+    return {
+        "exporter": exporter,
+        "importer": importer,
+        "product": "",
+        "hs_code": hs_match.group(0),
+        "extraction_status": "complete" if exporter and importer else "partial_but_usable"
+    }
+
+_QUERY_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+def _normalize_query(query: str) -> str:
+    """Forme canonique d'une requête pour le cache exact : minuscules, sans ponctuation, espaces réduits."""
+    return " ".join(_QUERY_PUNCTUATION_RE.sub(" ", query.lower()).split())
+
+def _cached_extraction_fits_query(query: str, data: Dict[str, Any]) -> bool:
+    """
+    Vérifie qu'une extraction retrouvée par similarité porte sur les mêmes pays et le même code HS
+    que la requête : deux trajets ne différant que par un pays ont des embeddings très proches.
+    """
+    cached_countries = {find_valid_country_name(str(data.get(field, "")).strip()) for field in ("exporter", "importer")}
+    for match in _get_country_regex().finditer(query):
+        if _canonical_country_name(match.group(1).lower()) not in cached_countries:
+            return False
+    hs_match = _HS_CODE_IN_QUERY_RE.search(query)
+    return not hs_match or str(data.get("hs_code", "")).strip() == hs_match.group(0)
+
+def _extraction_cache_key(user_query: str) -> str:
+    # Même requête (à la casse et la ponctuation près), même prompt, même modèle :
+    # la réponse déjà analysée est réutilisée sans appel LLM
+    return make_cache_key(EXTRACTION_PROMPT_VERSION, config.GROQ_MODEL_NAME, _normalize_query(user_query))
+
+def _get_cached_extraction(user_query: str, cache_key: str) -> Optional[Dict[str, Any]]:
+    """Réponse LLM déjà analysée pour cette requête (cache exact, puis sémantique), sinon None."""
+    data = _extraction_cache.get(cache_key)
+    if data is not None:
+        logger.info(f"Extraction cache hit for query: '{user_query}'")
+        return data
+    semantic_cache = _get_semantic_cache("extraction")
+    if semantic_cache is not None:
+        data = semantic_cache.get(user_query)
+        if data is not None and _cached_extraction_fits_query(user_query, data):
+            # Requête reformulée : même extraction, la réponse est aussi mise en cache exact
+            _extraction_cache.set(cache_key, data)
+            return data
+    return None
+
+def _cache_extraction(user_query: str, cache_key: str, data: Dict[str, Any]):
+    _extraction_cache.set(cache_key, data)
+    semantic_cache = _get_semantic_cache("extraction")
+    if semantic_cache is not None:
+        semantic_cache.set(user_query, data)
+
+# Schéma de la réponse d'extraction : quatre champs texte, vides par défaut
+EXTRACTION_FIELDS = ("exporter", "importer", "product", "hs_code")
+
+def _coerce_extraction(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applique le schéma à la réponse du LLM (modifie data) : champ manquant ou null -> "",
+    nombre -> texte. Lève ValueError si la réponse n'est pas un objet JSON.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    for field in EXTRACTION_FIELDS:
+        value = data.get(field)
+        data[field] = "" if value is None else str(value)
+    return data
+
+def _finalize_extraction(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalise les pays, complète ou affine le code HS et fixe extraction_status (modifie data)."""
+    _coerce_extraction(data)
+    # --- Post-traitement et Validation ---
+    exporter_raw = data.get("exporter", "").strip()
+    importer_raw = data.get("importer", "").strip()
+    product_raw = data.get("product", "").strip()
+    hs_code_raw = data.get("hs_code", "").strip()
+
+    # 1. Validation/Correction des Pays
+    data["exporter"] = find_valid_country_name(exporter_raw)
+    data["importer"] = find_valid_country_name(importer_raw)
+
+    # 2. Validation/Recherche du Code HS
+    if not hs_code_raw and product_raw:
+        data["hs_code"] = find_hs_code_for_product(product_raw)
+        if not data["hs_code"]:
+            # Aucune description ne contient le nom tel quel : description contenant tous ses mots-clés
+            keyword_matches = find_hs_codes_in_text(product_raw, limit=1, min_coverage=1.0)
+            data["hs_code"] = keyword_matches[0] if keyword_matches else ""
+        if not data["hs_code"]:
+            # Nom mal orthographié : nouvel essai avec les mots corrigés d'après le vocabulaire HS
+            corrected_product = correct_product_spelling(product_raw)
+            if corrected_product != product_raw.lower():
+                data["hs_code"] = find_hs_code_for_product(corrected_product)
+        if data["hs_code"]:
+            logger.info(f"Found HS code {data['hs_code']} for product '{product_raw}'")
+    elif hs_code_raw.isdigit() and len(hs_code_raw) < HS_CODE_FULL_LENGTH:
+        data["hs_code"] = refine_partial_hs_code(hs_code_raw, product_raw)
+        if data["hs_code"] != hs_code_raw:
+            logger.info(f"Refined partial HS code {hs_code_raw} to {data['hs_code']} for product '{product_raw}'")
+
+    # 3. Décider du statut de l'extraction
+    # Nouvelle logique : On considère comme "suffisant" si on a au moins un pays ET un produit/HS code
+    # Cela permet de continuer même si un pays est manquant (comme dans le cas USMCA)
+    exporter = data.get("exporter", "")
+    importer = data.get("importer", "")
+    product_or_hs = data.get("hs_code", "") or data.get("product", "")
+
+    # Pour les accords, on peut avoir les deux pays identiques ou des placeholders
+    # On vérifie simplement qu'on a les infos nécessaires pour le scraping ou le RAG
+    if (exporter or importer) and product_or_hs:
+         # On considère que l'extraction est suffisante si on a un pays ET un produit/code
+         # Même si un pays est manquant, le scraper/RAG pourra peut-être gérer
+         data["extraction_status"] = "partial_but_usable"
+         logger.info(f"Extraction usable (partial): exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
+    elif exporter and importer and product_or_hs:
+        data["extraction_status"] = "complete"
+        logger.info(f"Extraction complete: exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
+    else:
+        data["extraction_status"] = "insufficient"
+        logger.warning(f"Insufficient information for full processing: exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
+    return data
+
+# --- Extract_trade_info ---
+def extract_trade_info(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrait les informations de pays et de produit/HS code de la requête utilisateur.
+    Gère les cas spéciaux comme les accords commerciaux.
+    """
+    user_query = state.get("user_query", "")
+    if not user_query:
+        logger.error("No user query provided for extraction.")
+        return {"error": "No user query provided for extraction."}
+
+    logger.info(f"Extracting trade info from query: '{user_query}'")
+
+    # Requête déjà structurée (code HS + pays) : pas besoin du LLM
+    rule_based_info = _rule_based_extract(user_query)
+    if rule_based_info is not None:
+        logger.info(f"Rule-based extraction complete, skipping LLM: {rule_based_info}")
+        return {"extracted_info": rule_based_info}
+
+    try:
+        llm_client = _get_llm()
+    except Exception as e:
+        logger.error(f"Failed to initialize LLM client inside tool: {e}")
+        return {"error": f"LLM Client init failed: {e}", "extracted_info": {}}
+    
+    # --- Prompt avec gestion des accords ---
+    extraction_prompt = _EXTRACTION_USER_TEMPLATE.format(query=user_query)
     
     messages = [
-        {"role": "system", "content": "You are a precise data extraction tool."},
+        _EXTRACTION_SYSTEM_MESSAGE,
         {"role": "user", "content": extraction_prompt}
     ]
     
+    cache_key = _extraction_cache_key(user_query)
+
     try:
-        raw_response = llm_client.generate(messages, max_tokens=300, temperature=0.1)
-        import json as json_lib
         try:
-            data = json_lib.loads(raw_response)
+            data = _get_cached_extraction(user_query, cache_key)
+            if data is None:
+                # Génération arrêtée dès la fermeture de l'objet JSON (le reste est ignoré au parsing)
+                raw_response = llm_client.generate_until_json(messages, max_tokens=300, temperature=0.1)
+                data = _coerce_extraction(_parse_llm_json(raw_response))
+                _cache_extraction(user_query, cache_key, data)
             logger.info(f"Raw extracted info: {data}")
-            
-            # --- Post-traitement et Validation ---
-            exporter_raw = data.get("exporter", "").strip()
-            importer_raw = data.get("importer", "").strip()
-            product_raw = data.get("product", "").strip()
-            hs_code_raw = data.get("hs_code", "").strip()
-
-            # 1. Validation/Correction des Pays
-            def find_valid_country_name(raw_name):
-                if not raw_name:
-                    return ""
-                # Gestion des cas spéciaux
-                if "usmca" in raw_name.lower():
-                    # On peut choisir un pays représentatif ou laisser le placeholder
-                    # Pour simplifier, on prend les USA et le Mexique comme exemple
-                    # Une logique plus complexe pourrait être implémentée ici
-                    return "United States Of America" # Ou "Mexico" ou "Canada"
-                if "eu" in raw_name.lower() or "european union" in raw_name.lower():
-                    return "Germany" # Ou un autre pays membre
-                
-                raw_lower = raw_name.lower()
-                if raw_lower in COUNTRY_MAP:
-                    return COUNTRY_MAP[raw_lower]
-                return raw_name
-
-            data["exporter"] = find_valid_country_name(exporter_raw)
-            data["importer"] = find_valid_country_name(importer_raw)
-
-            # 2. Validation/Recherche du Code HS
-            if not hs_code_raw and product_raw:
-                data["hs_code"] = find_hs_code_for_product(product_raw)
-                if data["hs_code"]:
-                    logger.info(f"Found HS code {data['hs_code']} for product '{product_raw}'")
-
-            # 3. Décider du statut de l'extraction
-            # Nouvelle logique : On considère comme "suffisant" si on a au moins un pays ET un produit/HS code
-            # Cela permet de continuer même si un pays est manquant (comme dans le cas USMCA)
-            exporter = data.get("exporter", "")
-            importer = data.get("importer", "")
-            product_or_hs = data.get("hs_code", "") or data.get("product", "")
-
-            # Pour les accords, on peut avoir les deux pays identiques ou des placeholders
-            # On vérifie simplement qu'on a les infos nécessaires pour le scraping ou le RAG
-            if (exporter or importer) and product_or_hs:
-                 # On considère que l'extraction est suffisante si on a un pays ET un produit/code
-                 # Même si un pays est manquant, le scraper/RAG pourra peut-être gérer
-                 data["extraction_status"] = "partial_but_usable"
-                 logger.info(f"Extraction usable (partial): exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
-            elif exporter and importer and product_or_hs:
-                data["extraction_status"] = "complete"
-                logger.info(f"Extraction complete: exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
-            else:
-                data["extraction_status"] = "insufficient"
-                logger.warning(f"Insufficient information for full processing: exporter='{exporter}', importer='{importer}', product/hs='{product_or_hs}'")
-
-            return {"extracted_info": data}
-        except json_lib.JSONDecodeError:
+            return {"extracted_info": _finalize_extraction(data)}
+        except json.JSONDecodeError:
             logger.error(f"LLM response was not valid JSON: {raw_response}")
             return {"error": "Failed to parse extracted information as JSON.", "extracted_info": {}}
     except Exception as e:
         logger.error(f"Error in extract_trade_info: {e}")
         return {"error": f"Error during extraction: {e}", "extracted_info": {}}
     
+async def extract_trade_info_batch_async(states: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Extrait plusieurs requêtes en parallèle : chaque extraction (appel LLM bloquant compris) tourne
+    dans un thread, au plus EXTRACTION_BATCH_CONCURRENCY à la fois pour rester sous les limites du fournisseur.
+    Les résultats sont dans le même ordre que les états.
+    """
+    semaphore = asyncio.Semaphore(config.EXTRACTION_BATCH_CONCURRENCY)
+
+    async def extract_one(state):
+        async with semaphore:
+            return await asyncio.to_thread(extract_trade_info, state)
+
+    return await asyncio.gather(*(extract_one(state) for state in states))
+
+def extract_trade_info_batch(states: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Version synchrone de extract_trade_info_batch_async (à appeler hors d'une boucle asyncio)."""
+    if not states:
+        return []
+    return asyncio.run(extract_trade_info_batch_async(states))
+
+def _extract_marshaled_chunk(llm_client, pending: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Un seul appel LLM pour plusieurs requêtes numérotées, réponse attendue en tableau JSON dans le même ordre.
+    Si le tableau est illisible ou n'a pas le bon nombre d'éléments, chaque requête repasse par extract_trade_info.
+    """
+    queries = "\n".join(f"{number}. {' '.join(user_query.split())}" for number, (user_query, _) in enumerate(pending, start=1))
+    messages = [
+        _EXTRACTION_BATCH_SYSTEM_MESSAGE,
+        {"role": "user", "content": f"Queries:\n{queries}"}
+    ]
+    try:
+        raw_response = llm_client.generate(messages, max_tokens=120 * len(pending), temperature=0.1)
+        items = _parse_llm_json(raw_response, brackets="[]")
+        if not isinstance(items, list) or len(items) != len(pending):
+            raise ValueError(f"expected a JSON array of {len(pending)} objects")
+        items = [_coerce_extraction(item) for item in items]
+    except Exception as e:
+        logger.warning(f"Batched extraction of {len(pending)} queries failed ({e}), extracting them one by one.")
+        return [extract_trade_info({"user_query": user_query}) for user_query, _ in pending]
+
+    results = []
+    for (user_query, cache_key), data in zip(pending, items):
+        _cache_extraction(user_query, cache_key, data)
+        results.append({"extracted_info": _finalize_extraction(data)})
+    return results
+
+def extract_trade_info_marshaled(states: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Extraction de nombreuses requêtes (évaluations, traitements par lots) avec peu d'appels LLM :
+    les requêtes non résolues par les règles ou les caches sont envoyées par groupes de
+    EXTRACTION_MARSHAL_BATCH_SIZE dans un même prompt (instructions envoyées une fois par groupe),
+    les groupes étant traités en parallèle. Les résultats sont dans le même ordre que les états.
+    Pour quelques requêtes interactives, extract_trade_info_batch (un appel par requête) a une latence plus faible.
+    """
+    batch_size = batch_size or config.EXTRACTION_MARSHAL_BATCH_SIZE
+    results: List[Optional[Dict[str, Any]]] = [None] * len(states)
+    pending_positions, pending = [], []
+    for position, state in enumerate(states):
+        user_query = state.get("user_query", "")
+        if not user_query or _rule_based_extract(user_query) is not None:
+            # Requête vide ou déjà structurée : même traitement qu'une extraction seule, sans LLM
+            results[position] = extract_trade_info(state)
+            continue
+        cache_key = _extraction_cache_key(user_query)
+        cached = _get_cached_extraction(user_query, cache_key)
+        if cached is not None:
+            results[position] = {"extracted_info": _finalize_extraction(cached)}
+        else:
+            pending_positions.append(position)
+            pending.append((user_query, cache_key))
+
+    if pending:
+        try:
+            llm_client = _get_llm()
+        except Exception as e:
+            logger.error(f"Failed to initialize LLM client inside tool: {e}")
+            for position in pending_positions:
+                results[position] = {"error": f"LLM Client init failed: {e}", "extracted_info": {}}
+            return results
+
+        chunks = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        logger.info(f"Extracting {len(pending)} queries in {len(chunks)} batched LLM calls.")
+        with ThreadPoolExecutor(max_workers=min(config.EXTRACTION_BATCH_CONCURRENCY, len(chunks))) as executor:
+            chunk_results = executor.map(functools.partial(_extract_marshaled_chunk, llm_client), chunks)
+            for position, result in zip(pending_positions, itertools.chain.from_iterable(chunk_results)):
+                results[position] = result
+    return results
+
 # --- Outil 2: Scraping de PDFs ---
+# Même format que le cache d'extraction (un JSON par clé, avec TTL) : chemin du mapping des URLs
+# et signature du dossier des PDFs au moment du scraping
+_scrape_cache = LLMResponseCache(config.SCRAPE_CACHE_DIR, config.SCRAPE_TTL_HOURS * 3600)
+
+def _scraped_pdfs_signature(urls_mapping_file: Optional[str]) -> str:
+    """Signature (nom, mtime, taille) des PDFs et du fichier de mapping des URLs."""
+    mapping_path = Path(urls_mapping_file) if urls_mapping_file else None
+    mapping_stat = mapping_path.stat() if mapping_path and mapping_path.exists() else None
+    return compute_pdfs_stat_signature(config.DATA_DIR, mapping_stat and (mapping_stat.st_mtime_ns, mapping_stat.st_size))
+
+# Accords multi-pays : pays (exportateur, importateur) utilisés par défaut pour le scraping
+_AGREEMENT_SCRAPE_COUNTRIES = {
+    "usmca": ("United States Of America", "Mexico"),
+    "european union": ("Germany", "France"),
+    "eu": ("Germany", "France"),
+}
+# Une seule recherche pour tous les accords ; "_" accepté autour du mot ("EU_Countries"), pas les lettres
+_AGREEMENT_PLACEHOLDER_RE = re.compile(
+    r"(?<![a-z])(" + "|".join(re.escape(name) for name in _AGREEMENT_SCRAPE_COUNTRIES) + r")(?![a-z])",
+    re.IGNORECASE
+)
+
 def run_scraper_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Exécute le scraper avec les informations extraites.
     Input: {'extracted_info': Dict}
-    Output: {'scraping_status': str}
+    Output: {'scraping_status': str, 'scraping_status_code': ToolStatus}
     """
 
-    try:
-        clean_pdfs_folder(config.DATA_DIR)
-    except Exception as e:
-        logger.error(f"Failed to clean PDFs folder before scraping: {e}")
-
     extracted_info = state.get("extracted_info", {})
     
     # Gérer les placeholders ou valeurs spéciales si nécessaire
@@ -222,74 +867,139 @@ def run_scraper_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     # 1. Tenter le scraping avec une valeur par défaut
     # 2. Arrêter et expliquer
     # Ici, on tente avec une valeur par défaut
-    if "usmca" in exporter.lower():
-        logger.info("Replacing USMCA exporter placeholder with USA for scraping.")
-        exporter = "United States Of America"
-    if "usmca" in importer.lower():
-        logger.info("Replacing USMCA importer placeholder with Mexico for scraping.")
-        importer = "Mexico"
-    if "eu" in exporter.lower() or "european union" in exporter.lower():
-        logger.info("Replacing EU exporter placeholder with Germany for scraping.")
-        exporter = "Germany"
-    if "eu" in importer.lower() or "european union" in importer.lower():
-        logger.info("Replacing EU importer placeholder with France for scraping.")
-        importer = "France"
+    exporter_agreement = _AGREEMENT_PLACEHOLDER_RE.search(exporter)
+    if exporter_agreement:
+        agreement = exporter_agreement.group(1).lower()
+        logger.info(f"Replacing {agreement.upper()} exporter placeholder with {_AGREEMENT_SCRAPE_COUNTRIES[agreement][0]} for scraping.")
+        exporter = _AGREEMENT_SCRAPE_COUNTRIES[agreement][0]
+    importer_agreement = _AGREEMENT_PLACEHOLDER_RE.search(importer)
+    if importer_agreement:
+        agreement = importer_agreement.group(1).lower()
+        logger.info(f"Replacing {agreement.upper()} importer placeholder with {_AGREEMENT_SCRAPE_COUNTRIES[agreement][1]} for scraping.")
+        importer = _AGREEMENT_SCRAPE_COUNTRIES[agreement][1]
+
+    # Le même trajet a été scrapé récemment et les PDFs sont toujours dans le dossier : ni nettoyage ni scraping
+    cache_key = make_cache_key(exporter, importer, product)
+    cached_scrape = _scrape_cache.get(cache_key)
+    if cached_scrape and cached_scrape.get("pdfs_signature") == _scraped_pdfs_signature(cached_scrape.get("urls_mapping_file")):
+        success_msg = f"Successfully scraped documents for {exporter} -> {importer} ({product}) (cache hit)."
+        logger.info(success_msg)
+        return {
+            "scraping_status": success_msg,
+            "scraping_status_code": ToolStatus.CACHE_HIT,
+            "urls_mapping_file": cached_scrape.get("urls_mapping_file")
+        }
+
+    # Découpages d'un scraping précédent jamais récupérés : leurs fichiers vont être supprimés
+    discard_background_parses()
+    try:
+        clean_pdfs_folder(config.DATA_DIR)
+    except Exception as e:
+        logger.error(f"Failed to clean PDFs folder before scraping: {e}")
 
     if not exporter or not importer or not product:
         error_msg = f"Missing information for scraping: Exporter='{exporter}', Importer='{importer}', Product/HS='{product}'"
         logger.error(error_msg)
-        return {"scraping_status": error_msg}
+        return {"scraping_status": error_msg, "scraping_status_code": ToolStatus.ERROR}
 
     logger.info(f"Running scraper for {exporter} -> {importer} ({product})")
     try:
-        urls_mapping_file_path = scrape_trade_pdfs(exporter, importer, product, output_dir="data")
+        # Chaque PDF est découpé dès son téléchargement ; update_rag_knowledge_base reprend les chunks
+        parse_in_background = functools.partial(
+            parse_pdf_in_background, chunk_size=config.CHUNK_SIZE, chunk_overlap=config.CHUNK_OVERLAP
+        )
+        urls_mapping_file_path = scrape_trade_pdfs(
+            exporter, importer, product, output_dir="data", on_pdf_downloaded=parse_in_background
+        )
         success_msg = f"Successfully scraped documents for {exporter} -> {importer} ({product})."
         logger.info(success_msg)
+        # Un scraping sans aucun PDF (échec silencieux, timeout...) n'est pas mis en cache
+        if any(config.DATA_DIR.glob("*.pdf")):
+            _scrape_cache.set(cache_key, {
+                "urls_mapping_file": urls_mapping_file_path,
+                "pdfs_signature": _scraped_pdfs_signature(urls_mapping_file_path)
+            })
         return {
             "scraping_status": success_msg,
+            "scraping_status_code": ToolStatus.OK,
             "urls_mapping_file": urls_mapping_file_path 
         }
 
     except Exception as e:
         error_msg = f"Error during scraping: {e}"
         logger.error(error_msg)
+        discard_background_parses()
         # --- Retourner aussi le chemin en cas d'erreur (probablement None ou un chemin invalide) ---
         return {
             "scraping_status": error_msg,
+            "scraping_status_code": ToolStatus.ERROR,
             "urls_mapping_file": None # Ou une valeur par défaut
         }
 
+# --- Outil 2b: Préchargement du RAG ---
+def preload_rag_resources(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Charge le modèle d'embeddings et le client LLM pendant que le scraper télécharge les PDFs
+    (branche parallèle du workflow) : la mise à jour du RAG et la réponse finale les trouvent prêts.
+    Ne modifie pas l'état ; en cas d'erreur, les étapes suivantes réessaieront de les charger.
+    """
+    try:
+        _get_embeddings()
+        _get_llm()
+    except Exception as e:
+        logger.warning(f"Preloading RAG resources failed: {e}")
+    return {}
+
 # --- Outil 3: Mise à Jour du RAG ---
 def update_rag_knowledge_base(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Met à jour la base de connaissances du RAG avec les nouveaux PDFs.
     Input: {} (pas d'input spécifique requis)
-    Output: {'rag_update_status': str}
+    Output: {'rag_update_status': str, 'rag_update_status_code': ToolStatus}
     """
     logger.info("Updating RAG knowledge base...")
     try:
-        documents = load_and_split_pdfs(config.DATA_DIR, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+        # Mêmes PDFs qu'au dernier build : ni chargement ni découpage, les index sur disque restent valables
+        if stored_indexes_match_pdfs(config):
+            msg = "RAG knowledge base unchanged (reused existing index)."
+            logger.info(msg)
+            discard_background_parses()
+            return {"rag_update_status": msg, "rag_update_status_code": ToolStatus.CACHE_HIT}
+
+        documents = load_and_split_pdfs(config.DATA_DIR, config.CHUNK_SIZE, config.CHUNK_OVERLAP, config.CHUNKS_CACHE_PATH)
         if not documents:
             msg = "No documents found in data/pdfs to update RAG."
             logger.warning(msg)
-            return {"rag_update_status": msg}
+            return {"rag_update_status": msg, "rag_update_status_code": ToolStatus.EMPTY}
         documents = clean_documents(documents)
 
-        vsm = VectorStoreManager(config)
-        vsm.build_or_load_store(documents) # Reconstruire à partir des nouveaux docs
+        # Les PDFs scrapés partagent souvent des passages identiques (préambules, annexes) :
+        # un seul exemplaire est encodé et indexé
+        # (hashs calculés une seule fois, réutilisés comme identifiants FAISS par add_documents)
+        unique_documents, chunk_hashes = dedupe_by_hash(documents)
+        duplicates = len(documents) - len(unique_documents)
+        logger.info(f"Removed {duplicates} duplicate chunks out of {len(documents)} ({duplicates / len(documents):.1%}).")
+        documents = unique_documents
+
+        vsm = VectorStoreManager(config, embeddings=_get_embeddings())
+        # Seuls les chunks nouveaux sont encodés ; index inchangés : le store chargé reste valable
+        if vsm.add_documents(documents, chunk_hashes):
+            invalidate_vsm()
         
         msg = f"RAG knowledge base updated with {len(documents)} document chunks."
         logger.info(msg)
-        return {"rag_update_status": msg}
+        return {"rag_update_status": msg, "rag_update_status_code": ToolStatus.OK}
     except Exception as e:
         error_msg = f"Error updating RAG knowledge base: {e}"
         logger.error(error_msg)
-        return {"rag_update_status": error_msg}
+        return {"rag_update_status": error_msg, "rag_update_status_code": ToolStatus.ERROR}
 
 # --- Outil 4: Interrogation du RAG ---
 def query_rag(state: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Interroge le RAG avec la question de l'utilisateur.
+    Interroge le RAG avec la question de l'utilisateur (en dehors du workflow).
+    Même logique que le nœud final generate_final_response (RAG, puis données MFN, puis réponse par défaut),
+    pour que la réponse ne soit construite qu'à un seul endroit.
     Input: {'user_query': str}
     Output: {'final_answer': str}
     """
@@ -300,72 +1010,11 @@ def query_rag(state: Dict[str, Any]) -> Dict[str, Any]:
          return {"final_answer": error_msg} # Renvoyer une erreur comme réponse finale
 
     logger.info(f"Querying RAG with question: '{user_question}'")
-    try:
-        vsm = VectorStoreManager(config)
-        vsm.build_or_load_store([]) 
-        
-        if vsm.ensemble_retriever is None:
-            logger.warning("RAG retriever is not available.")
-            # --- Chercher les données MFN ---
-            mfn_data_file = config.DATA_DIR.parent / 'mfn_data.json' # Chemin: data/mfn_data.json
-            logger.debug(f"Checking for MFN data file at: {mfn_data_file}")
-            if mfn_data_file.exists():
-                try:
-                    with open(mfn_data_file, 'r', encoding='utf-8') as f:
-                        mfn_data = json.load(f)
-                    
-                    logger.debug(f"Loaded MFN data: {mfn_data}")
-                    
-                    # --- Construction de la réponse MFN ---
-                    mfn_explanation = """
-Most Favoured Nation (MFN) Tariffs:
-The Most Favoured Nation principle is a key rule of the global trading system under the World Trade Organization (WTO). It means countries cannot normally discriminate between their trading partners when setting tariffs. MFN tariffs are the standard, non-discriminatory rates applied to imports from all WTO members in the absence of a preferential trade agreement.
-(See: https://www.wto.org/english/thewto_e/whatis_e/tif_e/fact2_e.htm)
-"""
-                    # 2. Données spécifiques extraites
-                    duties_info = mfn_data.get("duties", [])
-                    notes_info = mfn_data.get("notes", [])
-                    
-                    specific_duty_text = ""
-                    if duties_info:
-                        duty_lines = [f"  - Rate: {duty.get('rate', 'N/A')}, Type: {duty.get('type', 'N/A')}" for duty in duties_info]
-                        specific_duty_text = "Specific MFN tariff information found:\n" + "\n".join(duty_lines)
-                    else:
-                        specific_duty_text = "No specific MFN tariff rate was found for this product."
-
-                    notes_text = ""
-                    if notes_info:
-                        notes_lines = [f"  - Note: {note}" for note in notes_info[:3]] 
-                        notes_text = "\nAdditional notes:\n" + "\n".join(notes_lines)
-
-                    # 3. Conclusion
-                    conclusion = "\n\nConclusion: No regional trade agreements or preferential trade arrangements are currently in force for this specific trade route (Morocco to China) and product (Saffron/0910). The MFN rate is the applicable tariff."
-
-                    # Assembler la réponse finale
-                    final_answer = f"{mfn_explanation}\n{specific_duty_text}{notes_text}{conclusion}"
-                    
-                    logger.info("Generated answer based on MFN data.")
-                    return {"final_answer": final_answer}
-                    
-                except Exception as e:
-                    logger.error(f"Error processing MFN data file: {e}")
-                    # Fallback si erreur de lecture/parse
-                    return {"final_answer": "I couldn't find any specific trade documents or tariff information for this route and product."}
-            else:
-                logger.info("No MFN data file found.")
-                # Fallback si pas de fichier MFN
-                return {"final_answer": "I couldn't find any specific trade documents for the selected countries and product. This might mean there is no preferential trade agreement, or the information is not available in the database I searched."}
-        
-        # Si le retriever est disponible, procéder normalement
-        analyzer = LegalDocumentAnalyzer(vsm.get_retriever(), config)
-        answer = analyzer.ask(user_question)
-        logger.info("RAG query successful.")
-        return {"final_answer": answer}
-    except Exception as e:
-        error_msg = f"Error querying RAG: {e}"
-        logger.error(error_msg, exc_info=True) # Log avec traceback
-        # Renvoyer l'erreur comme réponse finale pour que l'utilisateur la voie
-        return {"final_answer": f"Sorry, I encountered an error while searching the documents: {str(e)}"}
+    return generate_final_response({
+        **state,
+        "rag_documents_count": state.get("rag_documents_count", 1),
+        "mfn_data_available": state.get("mfn_data_available", os.path.exists("data/mfn_data.json")),
+    })
 
 # --- Fonction utilitaire pour décider de la prochaine étape ---
 def route_based_on_extraction(state: Dict[str, Any]) -> str:
@@ -399,8 +1048,7 @@ def route_after_scraping(state: Dict[str, Any]) -> str:
     """
     Décide de la prochaine étape après le scraping.
     """
-    status = state.get("scraping_status", "")
-    if "Successfully" in status:
+    if state.get("scraping_status_code") in (ToolStatus.OK, ToolStatus.CACHE_HIT):
         return "update_rag"
     return "error"
 
@@ -409,19 +1057,29 @@ def route_after_rag_update(state: Dict[str, Any]) -> str:
     Décide de la prochaine étape après la mise à jour du RAG.
     """
     # Obtenir le statut de la mise à jour
-    status = state.get("rag_update_status", "")
-    logger.debug(f"RAG update status received: '{status}'")
+    status_code = state.get("rag_update_status_code")
+    logger.debug(f"RAG update status received: {status_code!r}")
     
-    # Accepter plusieurs indicateurs de succès
     # Même si aucun document n'a été trouvé, c'est une mise à jour "complète" (même si vide).
-    if "updated" in status.lower() or "no documents" in status.lower() or "warning" in status.lower():
+    if status_code in (ToolStatus.OK, ToolStatus.CACHE_HIT, ToolStatus.EMPTY):
         logger.info("Routing to 'query_rag' as RAG process (with or without docs) is complete.")
         return "query_rag"
     else:
-        logger.info(f"Routing to END due to unexpected RAG update status: '{status}'")
+        logger.info(f"Routing to END due to unexpected RAG update status: '{state.get('rag_update_status', '')}'")
         # Vous pouvez aussi router vers un nœud d'erreur personnalisé ici
         return "error" # ou "END"
 
+def emit_stream_token(token: str):
+    """
+    Envoie un token au flux "custom" de LangGraph (consommé par TradePilotAgent.run_stream).
+    Sans effet lorsque l'outil est appelé en dehors d'une exécution du graphe.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer({"token": token})
+
 def generate_final_response(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Génère la réponse finale en se basant sur l'état complet du workflow.
@@ -438,8 +1096,7 @@ def generate_final_response(state: Dict[str, Any]) -> Dict[str, Any]:
     scraped_urls_file = "data/scraped_urls.json"
     if os.path.exists(scraped_urls_file):
         try:
-            with open(scraped_urls_file, 'r', encoding='utf-8') as f:
-                scraped_urls_data = json.load(f)
+            scraped_urls_data = _load_json_cached(scraped_urls_file)
             logger.debug(f"Loaded {len(scraped_urls_data)} scraped URLs for referencing.")
         except Exception as e:
             logger.error(f"Failed to load scraped URLs for final response: {e}")
@@ -464,23 +1121,37 @@ def generate_final_response(state: Dict[str, Any]) -> Dict[str, Any]:
     if rag_docs_count > 0:
         logger.debug("RAG documents found, querying RAG...")
         try:
-            from retrieval.vector_store import VectorStoreManager
-            from core.analyzer import LegalDocumentAnalyzer
-            import config
-            
-            vsm = VectorStoreManager(config)
-            vsm.build_or_load_store([])
-            if vsm.ensemble_retriever:
+            answer_cache_key = _rag_answer_cache_key(user_question)
+            answer = _answer_cache.get(answer_cache_key)
+            semantic_cache = _get_semantic_cache("rag_answers")
+            if answer is None and semantic_cache is not None:
+                # Question reformulée (cache vidé à chaque modification des index)
+                answer = semantic_cache.get(user_question)
+            if answer is not None:
+                # Même question sur le même corpus : ni recherche ni appel LLM
+                logger.info("RAG answer cache hit.")
+                emit_stream_token(answer)
+            else:
+                vsm = _get_vsm()
+                if not vsm.ensemble_retriever:
+                    raise Exception("RAG retriever not available after update.")
                 analyzer = LegalDocumentAnalyzer(vsm.get_retriever(), config)
-                answer = analyzer.ask(user_question)
+                # Diffuser les tokens au fur et à mesure (stream_mode="custom") tout en accumulant la réponse
+                answer_parts = []
+                for token in analyzer.ask_stream(user_question):
+                    emit_stream_token(token)
+                    answer_parts.append(token)
+                answer = "".join(answer_parts)
+                if ANALYZER_ERROR_MARKER not in answer:
+                    _answer_cache.set(answer_cache_key, answer)
+                    if semantic_cache is not None:
+                        semantic_cache.set(user_question, answer)
 
-                references_section = format_references(scraped_urls_data)
-                final_answer = answer + references_section
+            references_section = format_references(scraped_urls_data)
+            final_answer = answer + references_section
 
-                logger.info("RAG query successful.")
-                return {"final_answer": final_answer}
-            else:
-                raise Exception("RAG retriever not available after update.")
+            logger.info("RAG query successful.")
+            return {"final_answer": final_answer}
         except Exception as e:
             logger.error(f"Error querying RAG in final response node: {e}")
            
@@ -490,8 +1161,7 @@ def generate_final_response(state: Dict[str, Any]) -> Dict[str, Any]:
         logger.debug("No RAG docs or RAG failed, but MFN data is available.")
         mfn_data_file = "data/mfn_data.json"
         try:
-            with open(mfn_data_file, 'r', encoding='utf-8') as f:
-                mfn_data = json.load(f)
+            mfn_data = _load_json_cached(mfn_data_file)
             
             # --- Construction de la réponse MFN ---
             mfn_explanation = (
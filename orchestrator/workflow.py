@@ -1,16 +1,20 @@
 # orchestrator/workflow.py
+import os
 import logging
-from typing import Annotated, Dict, Any, Literal
+import threading
+from typing import Annotated, Dict, Any, List, Literal, Union
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
+import config
 
 from orchestrator.tools import (
     extract_trade_info,
     run_scraper_tool,
+    preload_rag_resources,
     update_rag_knowledge_base,
-    generate_final_response 
+    generate_final_response,
+    ToolStatus
 )
 
 logger = logging.getLogger(__name__)
@@ -20,8 +24,10 @@ class GraphState(TypedDict):
     user_query: str
     extracted_info: dict
     scraping_status: str
+    scraping_status_code: int # ToolStatus
     scraping_success: bool 
     mfn_data_available: bool # indicateur pour MFN
+    rag_update_status_code: int # ToolStatus
     rag_documents_count: int # nombre de documents chargés
     final_answer: str
 
@@ -35,29 +41,31 @@ def node_scrape_pdfs(state: GraphState) -> dict:
     logger.info("Executing: Scrape PDFs Node")
     result = run_scraper_tool(state)
     # On détermine si le scraping est un "succès" (même s'il n'y a pas de PDFs)
-    # en vérifiant le message de statut ou en vérifiant l'existence de mfn_data.json
-    import os
-    scraping_status = result.get("scraping_status", "")
-    scraping_success = "Successfully scraped" in scraping_status or "No documents were found" in scraping_status
+    # à partir du code de statut, ou en vérifiant l'existence de mfn_data.json
+    scraping_success = result.get("scraping_status_code") in (ToolStatus.OK, ToolStatus.CACHE_HIT, ToolStatus.EMPTY)
     mfn_available = os.path.exists("data/mfn_data.json") # Vérification simple
     return {**result, "scraping_success": scraping_success, "mfn_data_available": mfn_available}
 
+def node_preload_rag(state: GraphState) -> dict:
+    logger.info("Executing: Preload RAG Node")
+    return preload_rag_resources(state)
+
 def node_update_rag(state: GraphState) -> dict:
     logger.info("Executing: Update RAG Node")
     result = update_rag_knowledge_base(state)
     # On peut compter les documents ou vérifier le statut
     # Pour cet exemple, on met un indicateur simple.
-    rag_status = result.get("rag_update_status", "")
     docs_count = 0 
-    if "updated" in rag_status.lower():
+    if result.get("rag_update_status_code") in (ToolStatus.OK, ToolStatus.CACHE_HIT):
         docs_count = 1 
     return {**result, "rag_documents_count": docs_count}
 
 # --- Fonctions de Routage ---
-def route_after_extraction(state: GraphState) -> Literal["scrape_pdfs", "__end__"]:
+def route_after_extraction(state: GraphState) -> Union[List[Literal["scrape_pdfs", "preload_rag"]], Literal["__end__"]]:
     # Vérifie si l'extraction était suffisante
     if state.get("extracted_info") and not state.get("error"):
-        return "scrape_pdfs"
+        # Scraping (réseau) et chargement des modèles (CPU/disque) en parallèle
+        return ["scrape_pdfs", "preload_rag"]
     return "__end__" # Ou un nœud d'erreur
 
 def route_after_scraping(state: GraphState) -> Literal["update_rag", "generate_final_response"]:
@@ -69,6 +77,20 @@ def route_after_scraping(state: GraphState) -> Literal["update_rag", "generate_f
     # Pour cet exemple, on considère qu'on continue pour vérifier RAG/MFN
     return "update_rag" 
 
+def _create_checkpointer():
+    """
+    Checkpointer SQLite (mode WAL) si WORKFLOW_CHECKPOINT_DB est défini, sinon None : un MemorySaver
+    copiait l'état après chaque nœud et gardait tous les runs en mémoire sans jamais les relire.
+    """
+    if not config.WORKFLOW_CHECKPOINT_DB:
+        return None
+    import sqlite3
+    from langgraph.checkpoint.sqlite import SqliteSaver # Dépendance optionnelle
+    connection = sqlite3.connect(config.WORKFLOW_CHECKPOINT_DB, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    logger.info(f"Workflow checkpoints saved to {config.WORKFLOW_CHECKPOINT_DB}")
+    return SqliteSaver(connection)
+
 # --- Construction du Graphe ---
 def create_workflow():
     logger.info("Creating LangGraph workflow (Agentic style)...")
@@ -76,24 +98,29 @@ def create_workflow():
 
     workflow.add_node("extract_info", node_extract_info)
     workflow.add_node("scrape_pdfs", node_scrape_pdfs)
+    workflow.add_node("preload_rag", node_preload_rag)
     workflow.add_node("update_rag", node_update_rag)
     workflow.add_node("generate_final_response", generate_final_response)
 
     workflow.add_edge(START, "extract_info")
     workflow.add_conditional_edges("extract_info", route_after_extraction)
-    workflow.add_edge("scrape_pdfs", "update_rag")
+    # update_rag attend la fin des deux branches
+    workflow.add_edge(["scrape_pdfs", "preload_rag"], "update_rag")
     # Tous les chemins après update_rag vont vers la réponse finale
     workflow.add_edge("update_rag", "generate_final_response")
     workflow.add_edge("generate_final_response", END)
 
-    memory = MemorySaver()
-    app = workflow.compile(checkpointer=memory)
+    app = workflow.compile(checkpointer=_create_checkpointer())
     logger.info("LangGraph workflow (Agentic) created and compiled.")
     return app
 
 _workflow_app = None
+_workflow_lock = threading.Lock()
 def get_workflow_app():
     global _workflow_app
+    # Double-checked locking : le graphe n'est compilé qu'une fois, même si plusieurs requêtes arrivent en même temps
     if _workflow_app is None:
-        _workflow_app = create_workflow()
+        with _workflow_lock:
+            if _workflow_app is None:
+                _workflow_app = create_workflow()
     return _workflow_app
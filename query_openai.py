@@ -1,28 +1,40 @@
 import os
-from openai import OpenAI
+import asyncio
+from openai import AsyncOpenAI
 
 token = os.getenv("GITHUB_TOKEN_API")
 
 endpoint = "https://models.github.ai/inference"
 model = "openai/gpt-5-mini"
+max_concurrency = 4 # Requêtes simultanées (limites de débit de l'endpoint)
 
-client = OpenAI(
-    base_url=endpoint,
-    api_key=token
-)
+system_message = {
+    "role": "system",
+    "content": "You are a skilled Arabic poet, expert in Mahmoud Darwich style."
+}
 
-response = client.chat.completions.create(
-    model=model,
-    messages=[
-        {
-            "role": "system",
-            "content": "You are a skilled Arabic poet, expert in Mahmoud Darwich style."
-        },
-        {
-            "role": "user",
-            "content": "Écris un poème court en arabe classique, dans le style de Mahmoud Darwich, sur mon stage en NLP et IA, décrivant les difficultés que je surmonte avec courage en tant qu’étudiant ingénieur, avec des images puissantes et un langage riche."  
-        }
-    ]
-)
+prompts = [
+    "Écris un poème court en arabe classique, dans le style de Mahmoud Darwich, sur mon stage en NLP et IA, décrivant les difficultés que je surmonte avec courage en tant qu’étudiant ingénieur, avec des images puissantes et un langage riche.",
+]
 
-print(response.choices[0].message.content)
+async def ask(client, semaphore, prompt):
+    async with semaphore:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[system_message, {"role": "user", "content": prompt}]
+        )
+    return response.choices[0].message.content
+
+async def main():
+    client = AsyncOpenAI(
+        base_url=endpoint,
+        api_key=token
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Toutes les requêtes partent ensemble : durée totale ~ la plus longue, pas la somme
+    answers = await asyncio.gather(*(ask(client, semaphore, prompt) for prompt in prompts))
+    for answer in answers:
+        print(answer)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+# retrieval/bm25_retriever.py
+"""Retriever BM25 basé sur bm25s (scores calculés par produit de matrices creuses scipy)."""
+
+import logging
+import pickle
+from pathlib import Path
+from typing import Any, List
+
+import bm25s
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_FILE_NAME = "documents.pkl"
+
+def tokenize_texts(texts: List[str]) -> List[List[str]]:
+    """Tokenisation partagée par l'indexation et les requêtes (minuscules, stopwords anglais retirés)."""
+    return bm25s.tokenize(texts, stopwords="en", return_ids=False, show_progress=False)
+
+class BM25SRetriever(BaseRetriever):
+    """
+    Remplace le BM25Retriever de LangChain (rank_bm25, boucles Python) par bm25s.
+    Les chunks sont gardés en listes de textes et de metadata (chargement du pickle ~3x plus rapide
+    qu'une liste de Document) ; seuls les k résultats d'une requête deviennent des Document.
+    """
+    bm25: Any
+    texts: List[str]
+    metadatas: List[dict]
+    k: int = 4
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], k: int = 4) -> "BM25SRetriever":
+        texts = [doc.page_content for doc in documents]
+        bm25 = bm25s.BM25()
+        bm25.index(tokenize_texts(texts), show_progress=False)
+        return cls(bm25=bm25, texts=texts, metadatas=[doc.metadata for doc in documents], k=k)
+
+    def save(self, save_dir: Path):
+        """Sauvegarde l'index (matrices creuses numpy + vocabulaire JSON) et les chunks (textes, metadata)."""
+        save_dir = Path(save_dir)
+        save_dir.mkdir(parents=True, exist_ok=True)
+        self.bm25.save(str(save_dir), show_progress=False)
+        with open(save_dir / DOCUMENTS_FILE_NAME, 'wb') as f:
+            pickle.dump((self.texts, self.metadatas), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, save_dir: Path, k: int = 4) -> "BM25SRetriever":
+        save_dir = Path(save_dir)
+        bm25 = bm25s.BM25.load(str(save_dir), show_progress=False)
+        with open(save_dir / DOCUMENTS_FILE_NAME, 'rb') as f:
+            saved = pickle.load(f)
+        if isinstance(saved, list):
+            # Ancien format : liste de Document
+            saved = ([doc.page_content for doc in saved], [doc.metadata for doc in saved])
+        texts, metadatas = saved
+        return cls(bm25=bm25, texts=texts, metadatas=metadatas, k=k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # Ignorer les tokens absents du vocabulaire de l'index
+        query_tokens = [token for token in tokenize_texts([query])[0] if token in self.bm25.vocab_dict]
+        if not query_tokens or not self.texts:
+            return []
+        k = min(self.k, len(self.texts))
+        results, _scores = self.bm25.retrieve([query_tokens], k=k, show_progress=False)
+        return [Document(page_content=self.texts[i], metadata=self.metadatas[i]) for i in results[0]]
@@ -0,0 +1,42 @@
+# retrieval/ensemble_retriever.py
+"""EnsembleRetriever dont les retrievers (FAISS, BM25) sont interrogés en parallèle."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, cast
+
+from langchain.retrievers import EnsembleRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import patch_config
+
+logger = logging.getLogger(__name__)
+
+# Pool partagé par toutes les requêtes : l'encodage de la requête (torch), la recherche FAISS
+# et le scoring bm25s (scipy) relâchent le GIL, les threads se recouvrent donc réellement
+_RETRIEVER_EXECUTOR = ThreadPoolExecutor(thread_name_prefix="ensemble-retriever")
+
+class ParallelEnsembleRetriever(EnsembleRetriever):
+    """Même fusion pondérée (RRF) que EnsembleRetriever, mais les retrievers tournent en même temps."""
+
+    def rank_fusion(
+        self,
+        query: str,
+        run_manager: CallbackManagerForRetrieverRun,
+        *,
+        config: Optional[RunnableConfig] = None,
+    ) -> List[Document]:
+        futures = [
+            _RETRIEVER_EXECUTOR.submit(
+                retriever.invoke,
+                query,
+                patch_config(config, callbacks=run_manager.get_child(tag=f"retriever_{i+1}")),
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+        retriever_docs = [
+            [Document(page_content=cast(str, doc)) if isinstance(doc, str) else doc for doc in future.result()]
+            for future in futures
+        ]
+        return self.weighted_reciprocal_rank(retriever_docs)
@@ -2,17 +2,103 @@
 """Utilitaires pour le système RAG."""
 
 import hashlib
+import json
 import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import xxhash # Hash non cryptographique (SIMD), bien plus rapide que SHA256 sur le contenu des PDFs
+except ImportError:
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
-def compute_pdfs_hash(pdfs_directory: Path) -> str:
+# Au-delà de cette taille, un PDF est hashé via mmap plutôt que lu par blocs
+HASH_MMAP_MIN_SIZE = 4 << 20
+# Taille des blocs lus par la boucle readinto (Python < 3.11, sans hashlib.file_digest)
+HASH_READ_BLOCK_SIZE = 256 << 10
+# Fichiers hashés en parallèle (lecture disque et hash se recouvrent d'un fichier à l'autre)
+HASH_MAX_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+def _new_content_hasher():
+    """Hasher du contenu des PDFs : xxh3_128 si xxhash est installé, sinon SHA256."""
+    return xxhash.xxh3_128() if xxhash is not None else hashlib.sha256()
+
+def _content_hash_name() -> str:
+    return "xxh3_128" if xxhash is not None else "sha256"
+
+def compute_chunk_hash(text: str) -> str:
+    """Hash SHA256 du contenu d'un chunk : sert d'identifiant stable dans le docstore FAISS."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def dedupe_by_hash(documents):
+    """Retourne les documents de contenu unique (premier gardé) et leurs hashs, dans l'ordre d'origine."""
+    unique_docs, hashes, seen = [], [], set()
+    for doc in documents:
+        doc_hash = compute_chunk_hash(doc.page_content)
+        if doc_hash not in seen:
+            seen.add(doc_hash)
+            unique_docs.append(doc)
+            hashes.append(doc_hash)
+    return unique_docs, hashes
+
+def _hash_pdf_file(pdf_file: Path) -> bytes:
+    """Digest du contenu d'un PDF (exécuté dans un thread : le hash en C relâche le GIL sur les gros blocs)."""
+    # Sans tampon Python (buffering=0) : file_digest lit déjà par blocs de 256 Kio, readinto va directement dans son tampon
+    with open(pdf_file, 'rb', buffering=0) as f:
+        if os.fstat(f.fileno()).st_size >= HASH_MMAP_MIN_SIZE:
+            # Gros fichier : hashé directement depuis le page cache, sans copie vers un tampon
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher = _new_content_hasher()
+                hasher.update(mapped)
+                return hasher.digest()
+        # Boucle lecture + hash en C (readinto dans un tampon réutilisé), sans objet bytes par bloc
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, _new_content_hasher).digest()
+        # Python < 3.11 (image python:3.10-slim) : même boucle, écrite à la main
+        hasher = _new_content_hasher()
+        buffer = bytearray(HASH_READ_BLOCK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+        return hasher.digest()
+
+def _load_file_digests(cache_path: Path) -> dict:
+    """Digests par fichier déjà calculés {nom: [mtime_ns, taille, digest hex]}, pour l'algorithme de hash courant."""
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get("algorithm") == _content_hash_name():
+            return cached.get("files", {})
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not read PDF hash cache {cache_path}: {e}")
+    return {}
+
+def _save_file_digests(cache_path: Path, file_digests: dict):
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump({"algorithm": _content_hash_name(), "files": file_digests}, f)
+    except Exception as e:
+        logger.warning(f"Could not save PDF hash cache to {cache_path}: {e}")
+
+def compute_pdfs_hash(pdfs_directory: Path, cache_path: Path = None) -> str:
     """
-    Calcule un hash SHA256 unique basé sur les noms et les contenus des fichiers PDF.
-    L'ordre des fichiers est trié pour assurer la cohérence.
+    Calcule un hash unique basé sur les noms et les contenus des fichiers PDF (xxh3_128, ou SHA256 sans xxhash :
+    c'est une empreinte de changement, pas une garantie cryptographique).
+    Chaque fichier est hashé dans un thread, puis les (nom, digest) sont combinés dans l'ordre trié des fichiers.
+    Si cache_path est donné, le digest d'un fichier dont (nom, mtime, taille) n'a pas changé est repris
+    du cache au lieu de relire le fichier.
     """
-    hash_sha256 = hashlib.sha256()
+    hash_sha256 = _new_content_hasher()
     
     if not pdfs_directory.exists():
         logger.warning(f"PDF directory {pdfs_directory} does not exist for hashing.")
@@ -33,31 +119,74 @@ def compute_pdfs_hash(pdfs_directory: Path) -> str:
         hash_sha256.update(b"")
         return hash_sha256.hexdigest()
 
+    cached_digests = _load_file_digests(cache_path) if cache_path is not None else {}
+    file_digests = {}
+    stat_keys = {}
+    to_hash = []
     for pdf_file in pdf_files:
+        relative_path_str = str(pdf_file.relative_to(pdfs_directory))
         try:
-            # 1. Mettre à jour le hash avec le nom du fichier (chemin relatif)
-            # Cela permet de détecter si des fichiers sont ajoutés/supprimés/renommés
-            relative_path_str = str(pdf_file.relative_to(pdfs_directory))
-            hash_sha256.update(relative_path_str.encode('utf-8'))
-            logger.debug(f"Hashing file name: {relative_path_str}")
-            
-            # 2. Mettre à jour le hash avec le contenu du fichier
-            # Cela permet de détecter si le contenu d'un fichier change
-            with open(pdf_file, 'rb') as f:
-                # Lire par blocs pour les gros fichiers
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_sha256.update(chunk)
-            logger.debug(f"Hashed content of: {pdf_file.name}")
-        except IOError as e:
+            stat = pdf_file.stat()
+            stat_keys[relative_path_str] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            pass # L'erreur de lecture sera journalisée par le hash du fichier
+        cached = cached_digests.get(relative_path_str)
+        if cached and cached[:2] == stat_keys.get(relative_path_str):
+            file_digests[relative_path_str] = cached[2]
+        else:
+            to_hash.append(pdf_file)
+
+    futures = {}
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=min(HASH_MAX_WORKERS, len(to_hash))) as executor:
+            futures = {pdf_file: executor.submit(_hash_pdf_file, pdf_file) for pdf_file in to_hash}
+
+    for pdf_file in pdf_files:
+        # 1. Le nom du fichier (chemin relatif) : détecte les fichiers ajoutés/supprimés/renommés
+        relative_path_str = str(pdf_file.relative_to(pdfs_directory))
+        hash_sha256.update(relative_path_str.encode('utf-8'))
+        # 2. Le digest du contenu : détecte un contenu modifié
+        try:
+            if pdf_file in futures:
+                file_digests[relative_path_str] = futures[pdf_file].result().hex()
+                logger.debug(f"Hashed content of: {pdf_file.name}")
+            hash_sha256.update(bytes.fromhex(file_digests[relative_path_str]))
+        except OSError as e:
             logger.warning(f"Could not read file {pdf_file} for hashing: {e}. Skipping file content in hash.")
             # On inclut le nom mais pas le contenu, le hash sera différent si le fichier devient lisible
-        except Exception as e:
-            logger.error(f"Unexpected error hashing file {pdf_file}: {e}. Skipping.")
+        # Toute autre erreur remonte : une signature réduite aux noms masquerait un contenu modifié
             
+    if cache_path is not None and to_hash:
+        _save_file_digests(cache_path, {
+            name: stat_keys[name] + [digest] for name, digest in file_digests.items() if name in stat_keys
+        })
+
     final_hash = hash_sha256.hexdigest()
-    logger.debug(f"Computed hash for {len(pdf_files)} files in {pdfs_directory}: {final_hash}")
+    logger.debug(f"Computed hash for {len(pdf_files)} files in {pdfs_directory} ({len(to_hash)} read): {final_hash}")
     return final_hash
 
+def compute_pdfs_stat_signature(pdfs_directory: Path, *extra) -> str:
+    """
+    Signature rapide (SHA256) basée sur (nom, mtime, taille) des PDFs, sans lire leur contenu.
+    Les valeurs de `extra` (paramètres de découpage...) sont incluses dans la signature.
+    """
+    hash_sha256 = hashlib.sha256()
+    for value in extra:
+        hash_sha256.update(repr(value).encode('utf-8'))
+
+    if not pdfs_directory.exists():
+        return hash_sha256.hexdigest()
+
+    for pdf_file in sorted(pdfs_directory.glob("*.pdf")):
+        try:
+            stat = pdf_file.stat()
+        except OSError as e:
+            logger.warning(f"Could not stat file {pdf_file} for signature: {e}")
+            continue
+        relative_path_str = str(pdf_file.relative_to(pdfs_directory))
+        hash_sha256.update(f"{relative_path_str}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8'))
+    return hash_sha256.hexdigest()
+
 def save_signature(signature: str, signature_path: Path):
     """Sauvegarde la signature dans un fichier."""
     try:
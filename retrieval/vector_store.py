@@ -1,26 +1,92 @@
 # retrieval/vector_store.py
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-import pickle
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 import logging
-from .helpers import compute_pdfs_hash, load_signature, save_signature
+import pickle
+import faiss
+import numpy as np
+from .helpers import compute_pdfs_hash, dedupe_by_hash, load_signature, save_signature
+from .bm25_retriever import BM25SRetriever
+from .ensemble_retriever import ParallelEnsembleRetriever
 import config
 
 logger = logging.getLogger(__name__)
 
+# Lecture de l'index en mémoire mappée : l'OS ne charge que les pages consultées,
+# et les workers partagent la même copie via le page cache
+FAISS_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+def _embedding_model_kwargs(device=None):
+    """
+    Arguments de SentenceTransformer : GPU si disponible (sauf EMBEDDING_DEVICE explicite),
+    avec des poids FP16 sur GPU (deux fois moins de mémoire, Tensor Cores), FP32 sur CPU.
+    """
+    import torch
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model_kwargs = {"device": device}
+    if device.startswith("cuda"):
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    logger.info(f"Embedding model will run on {device}.")
+    return model_kwargs
+
+def _embedding_batch_size(config, model_kwargs) -> int:
+    # Sur GPU, des lots plus grands occupent toutes les unités de calcul ; sur CPU ils n'accélèrent plus rien
+    if model_kwargs["device"].startswith("cuda"):
+        return config.EMBEDDING_GPU_BATCH_SIZE
+    return config.EMBEDDING_BATCH_SIZE
+
+class _LazyEmbeddings(Embeddings):
+    """Embeddings du manager, résolus au premier encodage (la première requête) et non au chargement du store."""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def embed_documents(self, texts):
+        return self.manager.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.manager.embeddings.embed_query(text)
+
+def stored_indexes_match_pdfs(config) -> bool:
+    """Vrai si les index FAISS et BM25 sur disque ont été construits à partir des PDFs actuels (hash du contenu)."""
+    if not ((Path(config.FAISS_INDEX_PATH) / "index.faiss").exists() and config.BM25_MODEL_PATH.exists()):
+        return False
+    last_signature = load_signature(config.PDFS_SIGNATURE_PATH)
+    return bool(last_signature) and last_signature == compute_pdfs_hash(config.DATA_DIR, config.PDF_HASH_CACHE_PATH)
+
 class VectorStoreManager:
-    def __init__(self, config):
+    def __init__(self, config, embeddings=None):
         self.config = config
-        self.embeddings = SentenceTransformerEmbeddings(model_name=config.EMBEDDING_MODEL_NAME)
+        # Un modèle déjà chargé peut être partagé entre plusieurs managers ; sinon il est chargé au premier usage
+        self._embeddings = embeddings
         self.db = None
         self.bm25_retriever = None
         self.faiss_retriever = None
         self.ensemble_retriever = None
 
+    @property
+    def embeddings(self):
+        """
+        Embeddings normalisés (cosinus = produit scalaire) et encodés par lots. Le modèle n'est chargé
+        qu'au premier encodage : charger des index existants ne le demande pas.
+        """
+        if self._embeddings is None:
+            model_kwargs = _embedding_model_kwargs(self.config.EMBEDDING_DEVICE)
+            self._embeddings = SentenceTransformerEmbeddings(
+                model_name=self.config.EMBEDDING_MODEL_NAME,
+                model_kwargs=model_kwargs,
+                encode_kwargs={"batch_size": _embedding_batch_size(self.config, model_kwargs), "normalize_embeddings": True}
+            )
+        return self._embeddings
+
     def build_or_load_store(self, documents):
         """
         Construit ou charge les index FAISS/BM25 de manière intelligente.
@@ -29,7 +95,7 @@ class VectorStoreManager:
         
         # 1. Calculer la signature actuelle des PDFs
         logger.info("Computing hash for current PDFs...")
-        current_signature = compute_pdfs_hash(self.config.DATA_DIR)
+        current_signature = compute_pdfs_hash(self.config.DATA_DIR, self.config.PDF_HASH_CACHE_PATH)
         logger.info(f"Current PDFs hash: {current_signature[:16]}...") # Log partiel pour concision
 
         # 2. Charger la signature sauvegardée
@@ -46,9 +112,8 @@ class VectorStoreManager:
         if faiss_exists and bm25_exists and signatures_match and has_previous_signature:
             logger.info("PDFs unchanged and indexes exist. Loading existing FAISS and BM25 indexes from disk...")
             try:
-                self.db = FAISS.load_local(self.config.FAISS_INDEX_PATH, self.embeddings, allow_dangerous_deserialization=True)
-                with open(self.config.BM25_MODEL_PATH, 'rb') as f:
-                    self.bm25_retriever = pickle.load(f)
+                self.db = self._load_faiss_store()
+                self.bm25_retriever = BM25SRetriever.load(self.config.BM25_MODEL_PATH)
                 logger.info("Indexes loaded successfully from disk.")
             except Exception as e:
                 logger.error(f"Error loading indexes from disk: {e}. Rebuilding them...")
@@ -67,7 +132,81 @@ class VectorStoreManager:
 
         self._setup_retrievers()
 
-    def _build_and_save_store(self, documents, signature: str):
+    def add_documents(self, documents, hashes=None):
+        """
+        Met à jour les index de manière incrémentale : chaque chunk est identifié par le hash de son contenu,
+        seuls les chunks absents de l'index sont encodés, et ceux qui ne sont plus dans les PDFs sont retirés.
+        hashes : résultat de dedupe_by_hash si l'appelant a déjà dédoublonné les documents.
+        Retourne False si les index sur disque contenaient déjà exactement ces chunks.
+        """
+        if hashes is None:
+            documents, hashes = dedupe_by_hash(documents)
+        current_signature = compute_pdfs_hash(self.config.DATA_DIR, self.config.PDF_HASH_CACHE_PATH)
+        index_dir = Path(self.config.FAISS_INDEX_PATH)
+
+        db = None
+        if (index_dir / "index.faiss").exists():
+            try:
+                # Chargé sans mmap : un index mappé en lecture seule ne peut pas être modifié
+                db = self._load_faiss_store(mmap=False)
+            except Exception as e:
+                logger.error(f"Error loading FAISS index for update: {e}. Rebuilding it...")
+
+        existing_ids = set(db.index_to_docstore_id.values()) if db is not None else set()
+        wanted_ids = set(hashes)
+        if not documents or not existing_ids & wanted_ids:
+            # Rien à réutiliser (premier build, ancien index sans identifiants par hash...) : construction complète
+            self._build_and_save_store(documents, current_signature, hashes)
+            self._setup_retrievers()
+            return True
+
+        stale_ids = [doc_id for doc_id in db.index_to_docstore_id.values() if doc_id not in wanted_ids]
+        new_docs = [(doc, doc_hash) for doc, doc_hash in zip(documents, hashes) if doc_hash not in existing_ids]
+        logger.info(f"Incremental update: {len(wanted_ids) - len(new_docs)} chunks reused, "
+                    f"{len(new_docs)} to embed, {len(stale_ids)} to remove.")
+
+        if not new_docs and not stale_ids and self.config.BM25_MODEL_PATH.exists():
+            # Mêmes chunks qu'au dernier build : rien à réécrire
+            self.db = db
+            self.bm25_retriever = BM25SRetriever.load(self.config.BM25_MODEL_PATH)
+            save_signature(current_signature, self.config.PDFS_SIGNATURE_PATH)
+            self._setup_retrievers()
+            return False
+
+        if stale_ids:
+            try:
+                db.delete(stale_ids)
+            except Exception as e:
+                # Certains index (HNSW, quantification binaire) ne supportent pas la suppression
+                logger.warning(f"FAISS index does not support removal ({e}). Rebuilding indexes.")
+                self._build_and_save_store(documents, current_signature, hashes)
+                self._setup_retrievers()
+                return True
+
+        if new_docs:
+            texts = [doc.page_content for doc, _ in new_docs]
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            db.add_embeddings(
+                zip(texts, vectors),
+                metadatas=[doc.metadata for doc, _ in new_docs],
+                ids=[doc_hash for _, doc_hash in new_docs]
+            )
+
+        self._configure_faiss_search(db.index)
+        self.db = db
+        self._save_faiss_store()
+        logger.info(f"FAISS index updated with {db.index.ntotal} vectors and saved to {self.config.FAISS_INDEX_PATH}")
+
+        # BM25 (bm25s) ne supporte pas l'ajout : reconstruit à partir des chunks, sans embeddings donc peu coûteux
+        self.bm25_retriever = BM25SRetriever.from_documents(documents)
+        self.bm25_retriever.save(self.config.BM25_MODEL_PATH)
+        logger.info(f"BM25 model saved to {self.config.BM25_MODEL_PATH}")
+
+        save_signature(current_signature, self.config.PDFS_SIGNATURE_PATH)
+        self._setup_retrievers()
+        return True
+
+    def _build_and_save_store(self, documents, signature: str, hashes=None):
         """
         Construit les index à partir des documents et sauvegarde la signature.
         """
@@ -81,15 +220,18 @@ class VectorStoreManager:
             return
             
         logger.info("Building FAISS and BM25 indexes from documents...")
-        # --- FAISS ---
-        self.db = FAISS.from_documents(documents, self.embeddings)
-        self.db.save_local(self.config.FAISS_INDEX_PATH)
-        logger.info(f"FAISS index saved to {self.config.FAISS_INDEX_PATH}")
-
-        # --- BM25 ---
-        self.bm25_retriever = BM25Retriever.from_documents(documents)
-        with open(self.config.BM25_MODEL_PATH, 'wb') as f:
-            pickle.dump(self.bm25_retriever, f)
+        # Les deux index sont indépendants : la tokenisation BM25 tourne pendant l'encodage des embeddings
+        # (torch et FAISS relâchent le GIL)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            bm25_future = executor.submit(BM25SRetriever.from_documents, documents)
+            # --- FAISS ---
+            self.db = self._build_faiss_store(documents, hashes)
+            self._save_faiss_store()
+            logger.info(f"FAISS index saved to {self.config.FAISS_INDEX_PATH}")
+
+            # --- BM25 ---
+            self.bm25_retriever = bm25_future.result()
+        self.bm25_retriever.save(self.config.BM25_MODEL_PATH)
         logger.info(f"BM25 model saved to {self.config.BM25_MODEL_PATH}")
 
         # --- Sauvegarder la nouvelle signature ---
@@ -97,6 +239,105 @@ class VectorStoreManager:
         logger.info(f"New PDFs signature saved.")
 
 
+    def _build_faiss_store(self, documents, hashes=None):
+        """
+        Encode les chunks par lots (vecteurs normalisés) et les indexe dans un index FAISS
+        en produit scalaire (FP16 par défaut : deux fois moins de mémoire qu'en FP32).
+        """
+        if hashes is None:
+            documents, hashes = dedupe_by_hash(documents)
+        texts = [doc.page_content for doc in documents]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+        index = self._create_faiss_index(vectors)
+        db = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+        # Identifiants = hash du contenu, pour les mises à jour incrémentales (add_documents)
+        db.add_embeddings(zip(texts, vectors), metadatas=[doc.metadata for doc in documents], ids=hashes)
+        logger.info(f"FAISS index built with {index.ntotal} vectors (dim={vectors.shape[1]}).")
+        return db
+
+    def _save_faiss_store(self):
+        """
+        Sauvegarde l'index FAISS dans un dossier temporaire puis remplace les fichiers par os.replace :
+        un store déjà chargé ailleurs garde son mmap sur l'ancien fichier (réécrire en place ce fichier
+        mappé ferait planter le processus avec un Bus error à la recherche suivante).
+        """
+        index_dir = Path(self.config.FAISS_INDEX_PATH)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".faiss-", dir=index_dir.parent)
+        try:
+            self.db.save_local(tmp_dir)
+            # index.pkl en dernier : un lecteur concurrent ne voit jamais un docstore plus récent que l'index
+            for file_name in ("index.faiss", "index.pkl"):
+                os.replace(os.path.join(tmp_dir, file_name), index_dir / file_name)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _load_faiss_store(self, mmap=True):
+        """
+        Équivalent de FAISS.load_local, mais l'index est mappé en mémoire (lecture seule)
+        au lieu d'être entièrement chargé en RAM.
+        """
+        index_dir = Path(self.config.FAISS_INDEX_PATH)
+        if mmap:
+            index = faiss.read_index(str(index_dir / "index.faiss"), FAISS_MMAP_FLAGS)
+        else:
+            index = faiss.read_index(str(index_dir / "index.faiss"))
+        self._configure_faiss_search(index)
+        with open(index_dir / "index.pkl", 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=_LazyEmbeddings(self),
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+
+    def _create_faiss_index(self, vectors):
+        """Crée (et entraîne si nécessaire) l'index FAISS en produit scalaire selon la configuration."""
+        num_vectors, dimension = vectors.shape
+        fp16_index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        if not self.config.FAISS_BINARY_QUANTIZATION:
+            index_type = self.config.FAISS_INDEX_TYPE
+            if index_type == "auto":
+                index_type = self.config.FAISS_IVF_INDEX_FACTORY if num_vectors >= self.config.FAISS_IVF_MIN_VECTORS else "SQfp16"
+            if index_type == "SQfp16":
+                return fp16_index
+
+            # Index approximatif (IVF, PQ, HNSW...) : recherche sous-linéaire, entraîné sur le corpus
+            index = faiss.index_factory(dimension, index_type, faiss.METRIC_INNER_PRODUCT)
+            if not index.is_trained:
+                # Un quantifieur scalaire (SQ8...) n'apprend que les bornes de chaque dimension : quelques vecteurs suffisent,
+                # contrairement aux centroïdes IVF/PQ
+                if num_vectors < self.config.FAISS_IVF_MIN_VECTORS and not index_type.startswith("SQ"):
+                    logger.warning(f"Only {num_vectors} vectors to train '{index_type}', falling back to an exact FP16 index.")
+                    return fp16_index
+                logger.info(f"Training FAISS '{index_type}' index on {num_vectors} vectors...")
+                index.train(vectors)
+            self._configure_faiss_search(index)
+            return index
+
+        # Quantification binaire : le signe de chaque dimension (48 octets pour 384 dims),
+        # recherche en distance de Hamming, puis re-scoring exact des k * facteur candidats en FP16
+        binary_index = faiss.IndexLSH(dimension, dimension, False, False)
+        binary_index.metric_type = faiss.METRIC_INNER_PRODUCT # Tri des scores re-calculés par similarité décroissante
+        index = faiss.IndexRefine(binary_index, fp16_index)
+        index.k_factor = self.config.FAISS_BINARY_RESCORE_FACTOR
+        return index
+
+    def _configure_faiss_search(self, index):
+        """Paramètres de recherche non persistés dans le fichier d'index (nprobe des index IVF)."""
+        ivf_index = faiss.try_extract_index_ivf(index)
+        if ivf_index is not None:
+            ivf_index.nprobe = self.config.FAISS_NPROBE
+
     def _setup_retrievers(self):
         """Sets up the FAISS and Ensemble retrievers."""
         # Gérer le cas où les index n'ont pas pu être chargés/construits
@@ -107,7 +348,8 @@ class VectorStoreManager:
 
         self.faiss_retriever = self.db.as_retriever(search_kwargs={'k': self.config.RETRIEVER_K})
         self.bm25_retriever.k = self.config.RETRIEVER_K
-        self.ensemble_retriever = EnsembleRetriever(
+        # FAISS et BM25 sont interrogés en parallèle puis fusionnés selon ENSEMBLE_WEIGHTS
+        self.ensemble_retriever = ParallelEnsembleRetriever(
             retrievers=[self.faiss_retriever, self.bm25_retriever],
             weights=self.config.ENSEMBLE_WEIGHTS
         )
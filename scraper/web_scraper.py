@@ -3,8 +3,15 @@ import os
 import logging
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
+from concurrent.futures import Future
 from playwright.sync_api import sync_playwright, TimeoutError
+import atexit
+import queue
+import threading
 import time
 import re
 import json
@@ -13,10 +20,30 @@ import json
 EXPORT_COUNTRY = os.getenv("SCRAPER_EXPORT_COUNTRY", "Morocco")
 IMPORT_COUNTRY = os.getenv("SCRAPER_IMPORT_COUNTRY", "United States Of America")
 PRODUCT_QUERY = os.getenv("SCRAPER_PRODUCT_QUERY", "olive")
+PDF_DOWNLOAD_WORKERS = int(os.getenv("SCRAPER_PDF_DOWNLOAD_WORKERS", "8")) # Téléchargements simultanés
+PDF_DOWNLOAD_CHUNK_SIZE = 256 * 1024 # Taille des blocs lus/écrits par write() lors du téléchargement
+RESULTS_WAIT_TIMEOUT_MS = 3000 # Attente max du rendu des résultats après apparition de #fta-horz-list
 
 # Logger
 logger = logging.getLogger(__name__)
 
+# Navigateur Playwright unique pour le processus, possédé par un thread dédié (voir _run_on_browser_thread)
+_browser_jobs = queue.Queue()
+_browser_thread = None
+_browser_thread_lock = threading.Lock()
+_playwright = None
+_browser = None
+
+# Session partagée par les threads de téléchargement : connexions keep-alive réutilisées (un seul handshake TLS par hôte)
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=max(16, PDF_DOWNLOAD_WORKERS),
+    max_retries=Retry(total=3, backoff_factor=0.3)
+)
+_SESSION.mount('https://', _adapter)
+_SESSION.mount('http://', _adapter)
+
 def clean_pdfs_folder(pdfs_directory: Path):
     """
     Supprime tous les fichiers PDF existants dans le dossier spécifié.
@@ -28,20 +55,22 @@ def clean_pdfs_folder(pdfs_directory: Path):
 
     logger.info(f"Cleaning existing PDFs in {pdfs_directory}")
     cleaned_count = 0
-    for item in pdfs_directory.iterdir():
-        # Supprimer uniquement les fichiers .pdf
-        if item.is_file() and item.suffix.lower() == '.pdf':
-            try:
-                item.unlink()
-                logger.debug(f"Deleted old PDF: {item.name}")
-                cleaned_count += 1
-            except Exception as e:
-                logger.warning(f"Failed to delete {item.name}: {e}")
-        # Supprimer les dossiers de logs ou autres si nécessaire
-        # elif item.is_dir():
-        #     shutil.rmtree(item)
-        #     logger.debug(f"Deleted old directory: {item.name}")
-        #     cleaned_count += 1
+    # os.scandir : DirEntry garde le type du fichier lu avec le listing (pas de stat ni de Path par entrée)
+    with os.scandir(pdfs_directory) as entries:
+        for item in entries:
+            # Supprimer uniquement les fichiers .pdf
+            if os.path.splitext(item.name)[1].lower() == '.pdf' and item.is_file():
+                try:
+                    os.unlink(item.path)
+                    logger.debug(f"Deleted old PDF: {item.name}")
+                    cleaned_count += 1
+                except Exception as e:
+                    logger.warning(f"Failed to delete {item.name}: {e}")
+            # Supprimer les dossiers de logs ou autres si nécessaire
+            # elif item.is_dir():
+            #     shutil.rmtree(item)
+            #     logger.debug(f"Deleted old directory: {item.name}")
+            #     cleaned_count += 1
     logger.info(f"Cleaned {cleaned_count} old PDF files from {pdfs_directory}")
 
 def create_folder_structure(base_data_dir: str):
@@ -54,14 +83,28 @@ def create_folder_structure(base_data_dir: str):
 
 def clean_filename(text, max_length=100):
     """Create a clean, safe filename from text."""
-    # Remove HTML tags if any
-    text = re.sub(r'<[^>]+>', '', text)
-    # Replace problematic characters
-    text = re.sub(r'[^\w\s\-_.]', '_', text)
-    # Replace multiple spaces/underscores with single underscore
-    text = re.sub(r'[\s_]+', '_', text)
+    # Une seule passe : balises HTML retirées, tout caractère autre que lettre/chiffre/-/.
+    # (espaces et underscores compris) remplacé par un seul underscore par séquence
+    out = []
+    last_underscore = False
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == '<':
+            # Une balise <...> non vide et fermée est supprimée, sinon '<' est un caractère interdit
+            end = text.find('>', i + 1)
+            if end > i + 1:
+                i = end + 1
+                continue
+        if c.isalnum() or c in '-.':
+            out.append(c)
+            last_underscore = False
+        elif not last_underscore:
+            out.append('_')
+            last_underscore = True
+        i += 1
     # Remove leading/trailing underscores
-    text = text.strip('_')
+    text = ''.join(out).strip('_')
     # Limit length
     if len(text) > max_length:
         text = text[:max_length].rsplit('_', 1)[0]
@@ -75,7 +118,7 @@ def download_pdf(pdf_url: str, filename: str, base_url: str, folder: str):
             pdf_url = urljoin(base_url, pdf_url)
         logger.info(f"Attempting to download PDF: {pdf_url}")
 
-        response = requests.get(pdf_url, stream=True, timeout=30)
+        response = _SESSION.get(pdf_url, stream=True, timeout=30)
         response.raise_for_status()
 
         # Ensure folder exists
@@ -88,7 +131,7 @@ def download_pdf(pdf_url: str, filename: str, base_url: str, folder: str):
         filepath = Path(folder) / clean_name
 
         with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
+            for chunk in response.iter_content(chunk_size=PDF_DOWNLOAD_CHUNK_SIZE):
                 f.write(chunk)
         logger.info(f"Successfully downloaded: {filepath}")
         # --- Retourner un dictionnaire avec l'URL et le chemin local ---
@@ -100,8 +143,11 @@ def download_pdf(pdf_url: str, filename: str, base_url: str, folder: str):
         logger.error(f"Error downloading PDF {pdf_url}: {e}")
         return None
 
-def scrape_all_pdfs_on_results_page(page, base_url, download_folder='data/pdfs'):
-    """Scrape and download all PDF links found on the results page."""
+def scrape_all_pdfs_on_results_page(page, base_url, download_folder='data/pdfs', on_pdf_downloaded=None):
+    """
+    Scrape and download all PDF links found on the results page.
+    on_pdf_downloaded(local_path) is called as soon as each PDF is written (from a download thread).
+    """
     logger.info("Starting to scrape all PDFs from the results page...")
     downloaded_files = []
     scraped_urls = []
@@ -114,29 +160,55 @@ def scrape_all_pdfs_on_results_page(page, base_url, download_folder='data/pdfs')
             logger.warning("Results container #fta-horz-list not found. Searching entire page.")
             results_container = page
         
-        pdf_links = results_container.query_selector_all('a[href$=".pdf"]')
+        # 1. Lire href + texte de tous les liens en un seul aller-retour avec le navigateur
+        # (Playwright n'est pas thread-safe : lecture faite ici, avant les téléchargements)
+        pdf_links = results_container.eval_on_selector_all(
+            'a[href$=".pdf"]',
+            "links => links.map(a => ({href: a.getAttribute('href'), text: a.innerText}))"
+        )
         logger.info(f"Found {len(pdf_links)} PDF links on the results page.")
 
+        downloads = []
+        used_filenames = set()
         for i, link in enumerate(pdf_links):
             try:
-                href = link.get_attribute('href')
-                link_text = link.inner_text().strip()
+                href = link['href']
+                link_text = (link['text'] or '').strip()
                 
                 if href:
                     # Use link text as filename base, or a generic name
                     filename_base = link_text if link_text else f"document_{i+1}"
-                    logger.info(f"Downloading PDF {i+1}/{len(pdf_links)}: {filename_base}")
-                    # --- Récupérer le résultat de download_pdf ---
-                    download_result = download_pdf(href, filename_base, base_url, download_folder)
-                    if download_result:
-                        downloaded_files.append(download_result["local_path"])
-                        # --- Stocker le lien original et le chemin local ---
-                        scraped_urls.append(download_result)
+                    # Deux liens de même texte ne doivent pas écrire dans le même fichier en parallèle
+                    if clean_filename(filename_base).lower() in used_filenames:
+                        filename_base = f"{filename_base}_{i+1}"
+                    used_filenames.add(clean_filename(filename_base).lower())
+                    downloads.append((href, filename_base))
                 else:
                     logger.warning(f"PDF link {i+1} has no href attribute.")
             except Exception as e:
                 logger.error(f"Error processing PDF link {i+1}: {e}")
 
+        # 2. Télécharger en parallèle (I/O réseau), les résultats gardent l'ordre des liens
+        def download(item):
+            href, filename_base = item
+            download_result = download_pdf(href, filename_base, base_url, download_folder)
+            if download_result and on_pdf_downloaded is not None:
+                try:
+                    on_pdf_downloaded(download_result["local_path"])
+                except Exception as e:
+                    logger.warning(f"on_pdf_downloaded callback failed for {download_result['local_path']}: {e}")
+            return download_result
+
+        if downloads:
+            logger.info(f"Downloading {len(downloads)} PDFs with up to {PDF_DOWNLOAD_WORKERS} parallel downloads...")
+            with ThreadPoolExecutor(max_workers=min(PDF_DOWNLOAD_WORKERS, len(downloads))) as executor:
+                download_results = list(executor.map(download, downloads))
+            for download_result in download_results:
+                if download_result:
+                    downloaded_files.append(download_result["local_path"])
+                    # --- Stocker le lien original et le chemin local ---
+                    scraped_urls.append(download_result)
+
         logger.info(f"Finished scraping PDFs. Total downloaded: {len(downloaded_files)}")
         return downloaded_files, scraped_urls
 
@@ -144,6 +216,18 @@ def scrape_all_pdfs_on_results_page(page, base_url, download_folder='data/pdfs')
         logger.error(f"An error occurred while scraping PDFs from the results page: {e}")
         return [], []
     
+def _wait_for_condition(page, expression, timeout_ms, arg=None):
+    """
+    Attend qu'une condition JS soit vraie dans la page, au plus timeout_ms (l'ancien délai fixe).
+    Retourne False au lieu de lever si le délai expire : l'appelant continue comme avant.
+    """
+    try:
+        page.wait_for_function(expression, arg=arg, timeout=timeout_ms)
+        return True
+    except TimeoutError:
+        logger.debug(f"Condition not met after {timeout_ms} ms, continuing.")
+        return False
+
 def click_non_pref_regime_checkbox(page):
     """
     Tente de cliquer sur la case 'Non-preferential regime' en s'assurant qu'elle est visible.
@@ -181,22 +265,20 @@ def click_non_pref_regime_checkbox(page):
             if filter_label and filter_label.is_visible():
                 filter_label.click()
                 logger.debug("Clicked on 'Filters' label to ensure container is active.")
-                page.wait_for_timeout(500) # Attendre un peu
+                _wait_for_condition(page, "el => el.offsetParent !== null", 500, arg=checkbox)
 
         # 4. Défilement et focus
         logger.debug("Attempting to scroll checkbox into view and focus...")
         
         # a. Faire défiler l'élément dans le viewport (bloc central)
+        # scrollIntoView / focus sans animation sont synchrones : pas d'attente nécessaire
         page.evaluate("""element => element.scrollIntoView({block: 'center', inline: 'nearest'})""", checkbox)
-        page.wait_for_timeout(1000) # Attendre le défilement
         
         # b. Forcer le focus sur la page/le body pour s'assurer que rien ne bloque
         page.evaluate("""document.body.focus()""")
-        page.wait_for_timeout(500)
         
         # c. Forcer le focus sur l'élément lui-même
         page.evaluate("""element => element.focus()""", checkbox)
-        page.wait_for_timeout(500)
 
         # 5. Vérifier la visibilité de l'élément
         if not checkbox.is_visible():
@@ -208,7 +290,6 @@ def click_non_pref_regime_checkbox(page):
             if label and label.is_visible():
                  logger.info("Found associated label, attempting to click it.")
                  label.click()
-                 page.wait_for_timeout(2000)
                  return True
             else:
                  logger.error("Checkbox and its associated label are not visible.")
@@ -221,7 +302,6 @@ def click_non_pref_regime_checkbox(page):
         try:
             checkbox.click(force=True)
             logger.info("Checkbox clicked successfully with force=True.")
-            page.wait_for_timeout(2000) # Attendre la mise à jour de l'UI
             return True
         except Exception as e:
             logger.debug(f"Force click failed: {e}")
@@ -230,7 +310,6 @@ def click_non_pref_regime_checkbox(page):
         try:
             page.evaluate("element => { if (element && typeof element.click === 'function') element.click(); }", checkbox)
             logger.info("Checkbox clicked successfully via JavaScript.")
-            page.wait_for_timeout(2000)
             return True
         except Exception as e:
             logger.debug(f"JavaScript click failed: {e}")
@@ -325,11 +404,81 @@ def extract_mfn_duty(page):
     
     return mfn_info
 
+def _browser_worker():
+    """Boucle du thread Playwright : exécute les tâches une par une."""
+    while True:
+        func, args, kwargs, future = _browser_jobs.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+def _run_on_browser_thread(func, *args, **kwargs):
+    """
+    Exécute func sur le thread qui possède le navigateur et attend son résultat.
+    Les objets Playwright sync sont liés au thread qui les a créés ; les runs LangGraph, eux,
+    tournent sur des threads jetables : tout passe donc par un seul thread qui vit autant que le processus.
+    """
+    global _browser_thread
+    if threading.current_thread() is _browser_thread:
+        return func(*args, **kwargs)
+    with _browser_thread_lock:
+        if _browser_thread is None:
+            _browser_thread = threading.Thread(target=_browser_worker, name="playwright-browser", daemon=True)
+            _browser_thread.start()
+            atexit.register(_close_browser)
+    future = Future()
+    _browser_jobs.put((func, args, kwargs, future))
+    return future.result()
+
+def _get_browser():
+    """
+    Chromium lancé une seule fois et réutilisé d'un run à l'autre (évite ~1 s de démarrage à froid).
+    À appeler uniquement depuis le thread Playwright.
+    """
+    global _playwright, _browser
+    if _browser is not None and _browser.is_connected():
+        return _browser
+    if _playwright is None:
+        _playwright = sync_playwright().start()
+    logger.info("Launching Chromium browser...")
+    _browser = _playwright.chromium.launch(headless=True, slow_mo=0)
+    return _browser
+
+def _shutdown_browser():
+    """Ferme Chromium et arrête le driver Playwright (depuis le thread Playwright)."""
+    global _playwright, _browser
+    if _browser is not None:
+        try:
+            _browser.close()
+        except Exception as e:
+            logger.debug(f"Error while closing browser: {e}")
+        _browser = None
+    if _playwright is not None:
+        try:
+            _playwright.stop()
+        except Exception as e:
+            logger.debug(f"Error while stopping Playwright: {e}")
+        _playwright = None
+    logger.info("Browser closed.")
+
+def _close_browser():
+    """Hook atexit : le thread Playwright est daemon, on lui demande de tout fermer avant la sortie."""
+    future = Future()
+    _browser_jobs.put((_shutdown_browser, (), {}, future))
+    try:
+        future.result(timeout=10)
+    except Exception as e:
+        logger.warning(f"Could not close Playwright browser at exit: {e}")
+
 def scrape_trade_pdfs(
     export_country: str = EXPORT_COUNTRY,
     import_country: str = IMPORT_COUNTRY,
     product_query: str = PRODUCT_QUERY,
-    output_dir: str = "data"
+    output_dir: str = "data",
+    on_pdf_downloaded=None
 ):
     """
     Simplified scraping function using Playwright for the /compare page.
@@ -339,7 +488,15 @@ def scrape_trade_pdfs(
     4. If preferential agreements found, download PDFs.
     5. If no agreements, try to scrape MFN data.
     6. Save a mapping of original URLs to local paths.
+    on_pdf_downloaded(local_path), if given, is called as soon as each PDF is downloaded.
     """
+    # Toute la session Playwright tourne sur le thread qui possède le navigateur partagé
+    return _run_on_browser_thread(
+        _scrape_trade_pdfs, export_country, import_country, product_query, output_dir, on_pdf_downloaded
+    )
+
+def _scrape_trade_pdfs(export_country: str, import_country: str, product_query: str, output_dir: str, on_pdf_downloaded):
+    """Corps de scrape_trade_pdfs, exécuté sur le thread Playwright."""
     # --- Validation des entrées ---
     if not export_country or not import_country or not product_query:
         logger.error(f"Invalid arguments for scraping: export='{export_country}', import='{import_country}', product='{product_query}'")
@@ -355,209 +512,231 @@ def scrape_trade_pdfs(
     pdfs_output_dir = os.path.join(output_dir, 'pdfs')
     urls_mapping_file = os.path.join(output_dir, 'scraped_urls.json')
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, slow_mo=0) 
-        page = browser.new_page()
+    browser = _get_browser()
+    # Un contexte neuf par run : cookies/état isolés, sans relancer Chromium
+    context = browser.new_context()
+    page = context.new_page()
 
+    try:
+        compare_url = "https://findrulesoforigin.org/en/home/compare"
+        logger.info(f"Navigating to compare page: {compare_url}")
+        page.goto(compare_url, wait_until="domcontentloaded")
+
+        # --- 2. Fill Export Country ---
+        logger.info(f"Selecting export country: {export_country}")
+        page.click("div.input.export .select2-selection")
+        page.fill("div.input.export input.select2-search__field", export_country)
+        # Enter valide l'option surlignée : attendre qu'elle corresponde à la saisie
+        _wait_for_condition(page, """country => {
+            const option = document.querySelector('.select2-results__option--highlighted');
+            return option !== null && option.innerText.toLowerCase().includes(country.toLowerCase());
+        }""", 1000, arg=export_country)
+        page.keyboard.press("Enter")
+        page.wait_for_selector("div.input.export .select2-selection__choice", timeout=3000)
+        logger.info("Export country selected.")
+
+        # --- 3. Fill Import Country ---
+        logger.info(f"Selecting import country: {import_country}")
+        page.click("div.input.import .select2-selection")
+        _wait_for_condition(page, """() => {
+            const input = document.querySelector('.select2-container--open input.select2-search__field');
+            return input !== null && input.offsetParent !== null;
+        }""", 1500)
+        
+        import_input_selectors = [
+            "div.input.import input.select2-search__field",
+            ".select2-container--open input.select2-search__field",
+            "input.select2-search__field"
+        ]
+        
+        search_input_import = None
+        for selector in import_input_selectors:
+            try:
+                search_input_import = page.query_selector(selector)
+                if search_input_import and search_input_import.is_visible():
+                     logger.debug(f"Found import search input with selector: {selector}")
+                     break
+            except Exception as e:
+                 logger.debug(f"Exception finding input with {selector}: {e}")
+                 continue
+        
+        if not search_input_import:
+            logger.error("Could not find the visible input field for import country search.")
+            return urls_mapping_file
+        else:
+            logger.debug("Filling import country search input...")
+            search_input_import.fill(import_country)
+            # Attendre que la liste filtrée propose le pays (et non les options d'avant la saisie)
+            _wait_for_condition(page, """country => Array.from(document.querySelectorAll('.select2-results__option'))
+                .some(option => option.innerText.toLowerCase().includes(country.toLowerCase()))""", 1500, arg=import_country)
+
+        # --- Select the Import Country Option ---
+        logger.debug("Attempting to select the import country option from the dropdown...")
         try:
-            compare_url = "https://findrulesoforigin.org/en/home/compare"
-            logger.info(f"Navigating to compare page: {compare_url}")
-            page.goto(compare_url, wait_until="domcontentloaded")
-
-            # --- 2. Fill Export Country ---
-            logger.info(f"Selecting export country: {export_country}")
-            page.click("div.input.export .select2-selection")
-            page.fill("div.input.export input.select2-search__field", export_country)
-            page.wait_for_timeout(1000)
-            page.keyboard.press("Enter")
-            page.wait_for_selector("div.input.export .select2-selection__choice", timeout=3000)
-            logger.info("Export country selected.")
-
-            # --- 3. Fill Import Country ---
-            logger.info(f"Selecting import country: {import_country}")
-            page.click("div.input.import .select2-selection")
-            page.wait_for_timeout(1500) 
-            
-            import_input_selectors = [
-                "div.input.import input.select2-search__field",
-                ".select2-container--open input.select2-search__field",
-                "input.select2-search__field"
-            ]
+            page.wait_for_selector(".select2-results__option", timeout=3000)
+            logger.debug("Dropdown options appeared.")
             
-            search_input_import = None
-            for selector in import_input_selectors:
-                try:
-                    search_input_import = page.query_selector(selector)
-                    if search_input_import and search_input_import.is_visible():
-                         logger.debug(f"Found import search input with selector: {selector}")
-                         break
-                except Exception as e:
-                     logger.debug(f"Exception finding input with {selector}: {e}")
-                     continue
-            
-            if not search_input_import:
-                logger.error("Could not find the visible input field for import country search.")
-                return urls_mapping_file
+            option_clicked = False
+            exact_option = page.query_selector(f".select2-results__option:text-is('{import_country}')")
+            if exact_option:
+                logger.debug(f"Found exact match option: '{exact_option.inner_text().strip()}'")
+                exact_option.click()
+                option_clicked = True
             else:
-                logger.debug("Filling import country search input...")
-                search_input_import.fill(import_country)
-                page.wait_for_timeout(1500)
-
-            # --- Select the Import Country Option ---
-            logger.debug("Attempting to select the import country option from the dropdown...")
-            try:
-                page.wait_for_selector(".select2-results__option", timeout=3000)
-                logger.debug("Dropdown options appeared.")
-                
-                option_clicked = False
-                exact_option = page.query_selector(f".select2-results__option:text-is('{import_country}')")
-                if exact_option:
-                    logger.debug(f"Found exact match option: '{exact_option.inner_text().strip()}'")
-                    exact_option.click()
-                    option_clicked = True
-                else:
-                    logger.debug("No exact match found, searching for partial match...")
-                    options = page.query_selector_all(".select2-results__option")
-                    for option in options:
-                        option_text = option.inner_text().strip()
-                        if import_country.lower() in option_text.lower():
-                            logger.debug(f"Clicking partial match option: '{option_text}'")
-                            option.click()
-                            option_clicked = True
-                            break
-                    
-                if not option_clicked:
-                    logger.warning("No matching option found by text. Clicking the first available option.")
-                    first_option = page.query_selector(".select2-results__option")
-                    if first_option:
-                        first_option.click()
+                logger.debug("No exact match found, searching for partial match...")
+                options = page.query_selector_all(".select2-results__option")
+                for option in options:
+                    option_text = option.inner_text().strip()
+                    if import_country.lower() in option_text.lower():
+                        logger.debug(f"Clicking partial match option: '{option_text}'")
+                        option.click()
                         option_clicked = True
-                    else:
-                        raise Exception("No options available to click after dropdown appeared.")
+                        break
                 
-                if option_clicked:
-                    logger.info("Import country option selected.")
-                    page.keyboard.press("Escape")
-                    page.wait_for_timeout(500)
+            if not option_clicked:
+                logger.warning("No matching option found by text. Clicking the first available option.")
+                first_option = page.query_selector(".select2-results__option")
+                if first_option:
+                    first_option.click()
+                    option_clicked = True
                 else:
-                    raise Exception("Failed to click any option.")
-                
-            except TimeoutError:
-                logger.error("Timeout waiting for import dropdown options to appear.")
-                page.keyboard.press("Escape")
-                return urls_mapping_file
-            except Exception as select_e:
-                logger.error(f"Error selecting import country option or closing dropdown: {select_e}")
+                    raise Exception("No options available to click after dropdown appeared.")
+            
+            if option_clicked:
+                logger.info("Import country option selected.")
                 page.keyboard.press("Escape")
-                return urls_mapping_file
-
-            logger.info("Waiting for import selection to fully stabilize and dropdown to close...")
-            page.wait_for_timeout(3000)
-
-            # --- 4. Type Product/HS Code ---
-            logger.info(f"Typing product / HS code: {product_query}")
-            product_input = page.query_selector("#product-list")
-            if product_input:
-                product_input.fill(product_query)
-                page.wait_for_timeout(1000)
             else:
-                logger.error("Could not find product input field #product-list")
-                return urls_mapping_file
+                raise Exception("Failed to click any option.")
+            
+        except TimeoutError:
+            logger.error("Timeout waiting for import dropdown options to appear.")
+            page.keyboard.press("Escape")
+            return urls_mapping_file
+        except Exception as select_e:
+            logger.error(f"Error selecting import country option or closing dropdown: {select_e}")
+            page.keyboard.press("Escape")
+            return urls_mapping_file
+
+        logger.info("Waiting for import selection to fully stabilize and dropdown to close...")
+        _wait_for_condition(page, """() => document.querySelector('div.input.import .select2-selection__choice') !== null
+            && document.querySelector('.select2-container--open') === null""", 3500)
+
+        # --- 4. Type Product/HS Code ---
+        logger.info(f"Typing product / HS code: {product_query}")
+        product_input = page.query_selector("#product-list")
+        if product_input:
+            product_input.fill(product_query)
+        else:
+            logger.error("Could not find product input field #product-list")
+            return urls_mapping_file
 
-            try:
-                page.wait_for_selector("#ui-id-1 li", timeout=2000) 
-                logger.debug("Autocomplete options appeared.")
-                page.keyboard.press("ArrowDown")
-                page.keyboard.press("Enter")
-                logger.debug("Selected first autocomplete option.")
-                page.wait_for_timeout(1000)
-            except TimeoutError:
-                logger.debug("No quick autocomplete detected or selected.")
-                pass
-
-            # --- 5. Wait for Results to Load (Initiale) ---
-            logger.info("Waiting for initial results to load in #fta-horz-list...")
-            page.wait_for_selector('#fta-horz-list', timeout=30000)
-            page.wait_for_timeout(3000) 
-
-            # ---  Vérifier le nombre d'accords ---
-            logger.info("Checking the number of agreements found...")
-            agreements_found = 0
-            try:
-                toggle_element = page.query_selector('div.found a.toggle')
-                if toggle_element:
-                    toggle_text = toggle_element.inner_text()
-                    logger.debug(f"Toggle text found: '{toggle_text}'")
-                    match = re.search(r'Total\s*(\d+)\s*Agreements', toggle_text)
-                    if match:
-                        agreements_found = int(match.group(1))
-                        logger.info(f"Number of agreements found: {agreements_found}")
-                    else:
-                        logger.warning(f"Could not parse agreement count from text: '{toggle_text}'. Assuming 0.")
+        try:
+            page.wait_for_selector("#ui-id-1 li", timeout=3000)
+            logger.debug("Autocomplete options appeared.")
+            page.keyboard.press("ArrowDown")
+            page.keyboard.press("Enter")
+            logger.debug("Selected first autocomplete option.")
+            # jQuery UI referme le menu et recopie le libellé choisi dans le champ une fois la sélection faite
+            _wait_for_condition(page, """() => {
+                const menu = document.querySelector('#ui-id-1');
+                const input = document.querySelector('#product-list');
+                return (menu === null || menu.offsetParent === null) && input !== null && input.value.trim() !== '';
+            }""", 1000)
+        except TimeoutError:
+            logger.debug("No quick autocomplete detected or selected.")
+            pass
+
+        # --- 5. Wait for Results to Load (Initiale) ---
+        logger.info("Waiting for initial results to load in #fta-horz-list...")
+        page.wait_for_selector('#fta-horz-list', timeout=30000)
+        # Attente évaluée dans la page : on repart dès que le compteur d'accords ou les résultats
+        # sont rendus, au plus tard après le même délai fixe qu'avant
+        _wait_for_condition(page, """() => {
+            const toggle = document.querySelector('div.found a.toggle');
+            if (toggle && /Total\\s*\\d+\\s*Agreements/.test(toggle.innerText)) return true;
+            const el = document.querySelector('#fta-horz-list');
+            const html = el ? el.innerHTML.trim() : '';
+            return html !== '' && html !== '<!-- ko if: FtaList --><!-- /ko -->';
+        }""", RESULTS_WAIT_TIMEOUT_MS)
+
+        # ---  Vérifier le nombre d'accords ---
+        logger.info("Checking the number of agreements found...")
+        agreements_found = 0
+        try:
+            toggle_element = page.query_selector('div.found a.toggle')
+            if toggle_element:
+                toggle_text = toggle_element.inner_text()
+                logger.debug(f"Toggle text found: '{toggle_text}'")
+                match = re.search(r'Total\s*(\d+)\s*Agreements', toggle_text)
+                if match:
+                    agreements_found = int(match.group(1))
+                    logger.info(f"Number of agreements found: {agreements_found}")
                 else:
-                    logger.warning("Toggle element for agreement count not found. Assuming 0 agreements.")
-            except Exception as e:
-                logger.error(f"Error while checking agreement count: {e}. Assuming 0 agreements.")
-            
-            pdfs_scraped = False
-            scraped_urls = []
-            mfn_data_extracted = {}
-
-            # --- 6. Gestion des cas : Accords trouvés vs Non-préférentiel ---
-            if agreements_found > 0:
-                # --- 6a. Accords préférentiels trouvés : Scraping des PDFs ---
-                logger.info("Agreements found. Initiating download of PDFs from the results page...")
-                downloaded_files, scraped_urls = scrape_all_pdfs_on_results_page(page, compare_url, pdfs_output_dir)
-                logger.info(f"Scraping process finished. Total PDFs downloaded to {pdfs_output_dir}: {len(downloaded_files)}")
-                pdfs_scraped = True
+                    logger.warning(f"Could not parse agreement count from text: '{toggle_text}'. Assuming 0.")
             else:
-                # --- 6b. Aucun accord trouvé : Activer le régime non-préférentiel ---
-                logger.info("No preferential agreements found. Attempting to scrape non-preferential regime data...")
-                try:
-                    success = click_non_pref_regime_checkbox(page)
-                    if success:
-                        logger.info("Non-preferential regime activated. Waiting for data to load...")
-                        page.wait_for_timeout(5000)
-                        
-                        mfn_data_extracted = extract_mfn_duty(page)
-                        logger.info(f"Extracted MFN data: {mfn_data_extracted}")
-                        
-                        # Sauvegarder les données MFN dans un fichier
-                        mfn_data_file = os.path.join(output_dir, 'mfn_data.json')
-                        try:
-                            with open(mfn_data_file, 'w') as f:
-                                json.dump(mfn_data_extracted, f, indent=4, ensure_ascii=False)
-                            logger.info(f"Saved MFN data to {mfn_data_file}")
-                        except Exception as e:
-                            logger.error(f"Failed to save MFN data to {mfn_data_file}: {e}")
-
-                        pdfs_scraped = True
-                    else:
-                        logger.error("Failed to activate non-preferential regime. No data could be scraped.")
-                        
-                except Exception as e:
-                    logger.error(f"Error handling non-preferential regime: {e}")
-
-            # --- 7. Sauvegarder le mapping des URLs ---
-            # Si aucun PDF n'a été scrapé mais que des données MFN le sont, on peut l'indiquer
-            if not scraped_urls and mfn_data_extracted:
-                 # Option : créer un fichier d'indication 
-                 scraped_urls = [{"info": "No preferential PDFs found", "mfn_data_file": os.path.join(output_dir, 'mfn_data.json')}]
-
+                logger.warning("Toggle element for agreement count not found. Assuming 0 agreements.")
+        except Exception as e:
+            logger.error(f"Error while checking agreement count: {e}. Assuming 0 agreements.")
+        
+        pdfs_scraped = False
+        scraped_urls = []
+        mfn_data_extracted = {}
+
+        # --- 6. Gestion des cas : Accords trouvés vs Non-préférentiel ---
+        if agreements_found > 0:
+            # --- 6a. Accords préférentiels trouvés : Scraping des PDFs ---
+            logger.info("Agreements found. Initiating download of PDFs from the results page...")
+            downloaded_files, scraped_urls = scrape_all_pdfs_on_results_page(page, compare_url, pdfs_output_dir, on_pdf_downloaded)
+            logger.info(f"Scraping process finished. Total PDFs downloaded to {pdfs_output_dir}: {len(downloaded_files)}")
+            pdfs_scraped = True
+        else:
+            # --- 6b. Aucun accord trouvé : Activer le régime non-préférentiel ---
+            logger.info("No preferential agreements found. Attempting to scrape non-preferential regime data...")
             try:
-                with open(urls_mapping_file, 'w') as f:
-                    json.dump(scraped_urls, f, indent=4, ensure_ascii=False)
-                logger.info(f"Saved scraped URLs mapping to {urls_mapping_file}")
+                success = click_non_pref_regime_checkbox(page)
+                if success:
+                    logger.info("Non-preferential regime activated. Waiting for data to load...")
+                    _wait_for_condition(page, "() => document.querySelector('#fta-horz-list .summary-items .s-i') !== null", 7000)
+                    
+                    mfn_data_extracted = extract_mfn_duty(page)
+                    logger.info(f"Extracted MFN data: {mfn_data_extracted}")
+                    
+                    # Sauvegarder les données MFN dans un fichier
+                    mfn_data_file = os.path.join(output_dir, 'mfn_data.json')
+                    try:
+                        with open(mfn_data_file, 'w') as f:
+                            json.dump(mfn_data_extracted, f, indent=4, ensure_ascii=False)
+                        logger.info(f"Saved MFN data to {mfn_data_file}")
+                    except Exception as e:
+                        logger.error(f"Failed to save MFN data to {mfn_data_file}: {e}")
+
+                    pdfs_scraped = True
+                else:
+                    logger.error("Failed to activate non-preferential regime. No data could be scraped.")
+                    
             except Exception as e:
-                logger.error(f"Failed to save scraped URLs mapping to {urls_mapping_file}: {e}")
+                logger.error(f"Error handling non-preferential regime: {e}")
 
-        except TimeoutError as e:
-            logger.error(f"Timeout during scraping process: {e}")
+        # --- 7. Sauvegarder le mapping des URLs ---
+        # Si aucun PDF n'a été scrapé mais que des données MFN le sont, on peut l'indiquer
+        if not scraped_urls and mfn_data_extracted:
+             # Option : créer un fichier d'indication 
+             scraped_urls = [{"info": "No preferential PDFs found", "mfn_data_file": os.path.join(output_dir, 'mfn_data.json')}]
+
+        try:
+            with open(urls_mapping_file, 'w') as f:
+                json.dump(scraped_urls, f, indent=4, ensure_ascii=False)
+            logger.info(f"Saved scraped URLs mapping to {urls_mapping_file}")
         except Exception as e:
-            logger.error(f"An unexpected error occurred during scraping: {e}", exc_info=True)
-        finally:
-            browser.close()
-            logger.info("Browser closed.")
+            logger.error(f"Failed to save scraped URLs mapping to {urls_mapping_file}: {e}")
+
+    except TimeoutError as e:
+        logger.error(f"Timeout during scraping process: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during scraping: {e}", exc_info=True)
+    finally:
+        context.close()
+        logger.info("Browser context closed.")
 
     return urls_mapping_file
 
@@ -11,10 +11,12 @@ def create_interface():
     agent = get_agent()
 
     def process_question(question):
+        # Générateur : Gradio affiche la réponse au fur et à mesure qu'elle est produite
         if not question or not question.strip():
-            return "### Error\nPlease enter a question about trade regulations."
+            yield "### Error\nPlease enter a question about trade regulations."
+            return
         logger.info(f"Processing question with Agentic AI: {question}")
-        return agent.run(question)
+        yield from agent.run_stream(question)
 
     iface = gr.Interface(
         fn=process_question,